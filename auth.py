@@ -0,0 +1,121 @@
+"""Supabase Auth JWT verification with a local JWKS key cache and a verified-token LRU.
+
+Signing keys are kept by kid: loaded on the first lookup (concurrent callers wait for it), then refreshed
+in the background. Otherwise the JWKS endpoint is only hit on demand when a token carries a kid we have
+not seen (rate-limited), and a failed refresh keeps the old keys.
+Verified tokens are remembered by hash until their exp, so the same token arriving again skips the
+ES256 signature check entirely.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from jwt import PyJWKSet
+
+from fetch import fetch_json
+
+JWKS_REFRESH_INTERVAL_SECONDS = 10 * 60
+JWKS_MIN_FETCH_INTERVAL_SECONDS = 30  # at most one on-demand fetch per this many seconds for unknown kids
+VERIFIED_TOKEN_CACHE_SIZE = 4096
+
+
+class _JWKSCache:
+    def __init__(self):
+        self._keys: dict[str, object] = {}
+        self._last_fetch = 0.0  # last on-demand fetch for an unknown kid
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refresher: threading.Thread | None = None
+
+    def _jwks_url(self) -> str:
+        url = os.environ.get("SUPABASE_URL", "").rstrip("/")
+        if not url:
+            raise RuntimeError("SUPABASE_URL must be set")
+        return f"{url}/auth/v1/.well-known/jwks.json"
+
+    def refresh(self) -> None:
+        """Fetch the JWKS and replace the key map; on failure the previous keys stay in use."""
+        jwk_set = PyJWKSet.from_dict(fetch_json(self._jwks_url()))
+        keys = {jwk.key_id: jwk.key for jwk in jwk_set.keys if jwk.key_id}
+        with self._lock:
+            self._keys = keys
+
+    def get_key(self, kid: str):
+        self._ensure_loaded()
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._last_fetch >= JWKS_MIN_FETCH_INTERVAL_SECONDS:
+            with self._lock:
+                fetch_needed = kid not in self._keys and time.monotonic() - self._last_fetch >= JWKS_MIN_FETCH_INTERVAL_SECONDS
+                if fetch_needed:
+                    self._last_fetch = time.monotonic()  # claim the fetch so concurrent callers don't repeat it
+            if fetch_needed:
+                self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+    def _ensure_loaded(self) -> None:
+        """Load the keys on first use (concurrent first callers wait for it) and start the background refresher."""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                self.refresh()
+            except Exception:
+                pass  # unknown kids still trigger the on-demand fetch in get_key
+            self._loaded = True
+            self._refresher = threading.Thread(target=self._refresh_loop, name="jwks_refresh", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(JWKS_REFRESH_INTERVAL_SECONDS)
+            try:
+                self.refresh()
+            except Exception:
+                pass
+
+
+_JWKS = _JWKSCache()
+# sha256(token) -> (exp, payload), least recently used first
+_VERIFIED: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+_VERIFIED_LOCK = threading.Lock()
+
+
+def verify_token(token: str) -> dict | None:
+    """Verify a Supabase access token (ES256, audience "authenticated"); return its payload or None."""
+    digest = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    with _VERIFIED_LOCK:
+        cached = _VERIFIED.get(digest)
+        if cached is not None:
+            if cached[0] > now:
+                _VERIFIED.move_to_end(digest)
+                return cached[1]
+            del _VERIFIED[digest]
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = _JWKS.get_key(kid) if kid else None
+        if key is None:
+            return None
+        payload = jwt.decode(
+            token,
+            key,
+            algorithms=["ES256"],
+            audience="authenticated",
+            options={"verify_aud": True},
+        )
+    except Exception:
+        return None
+    exp = payload.get("exp")
+    if exp:
+        with _VERIFIED_LOCK:
+            _VERIFIED[digest] = (float(exp), payload)
+            while len(_VERIFIED) > VERIFIED_TOKEN_CACHE_SIZE:
+                _VERIFIED.popitem(last=False)
+    return payload
@@ -1,35 +1,122 @@
-from substack_api import Newsletter
+import heapq
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 from context import get_article, summarize_article
+from llm import llm_route
+from relevance import score_texts
+from summarize_article import summary_id_for_url
+from substack import get_archive_posts
 from datetime import datetime, timedelta
 
-def build_list(cut_off=None):
+DIGEST_PATH = Path(__file__).parent / "digest.json"
+BUILD_LIST_CONCURRENCY = 8
+
+
+def build_list(cut_off=None, sort="date"):
+    """Return the digest of posts on or after cut_off ("yyyy-mm-dd"), newest first.
+
+    With sort="relevance" the items get a "relevance" score against the me/ context (relevance.py) and
+    come back most relevant first; the saved digest stays in date order.
+
+    The digest and a per-newsletter watermark (newest post_date already summarized) are persisted in
+    DIGEST_PATH, so each run only fetches and summarizes posts newer than the watermark and merges them
+    into the saved digest.
+    """
     if cut_off is None:
         cut_off = (datetime.now() - timedelta(days=10)).strftime("%Y-%m-%d")
     # open file newsletters.txt and read each line as a newsletter URL
     with open("newsletters.txt", "r") as file:
-        newsletters = [line.strip() for line in file.readlines()]
-    list = _build_list(newsletters, cut_off)
-    list.sort(key=lambda x: x["post_date"], reverse=True)
-    return list
-
-def _build_list(newsletters, cut_off):
-    # returns a list of dicts where each dict contains the title, url, and post_date
-    list = []
-    for newsletter_url in newsletters:
-        newsletter = Newsletter(newsletter_url)
-        recent_posts = newsletter.get_posts(limit=7)
-        for post in recent_posts:
-            metadata = post.get_metadata()
-            post_date = metadata.get("post_date")[:10]
-            if post_date < cut_off:
+        newsletters = [line.strip() for line in file.readlines() if line.strip()]
+    digest = _load_digest()
+    new_items = _build_list(newsletters, cut_off, digest["watermarks"])
+    new_items.sort(key=lambda x: x["post_date"], reverse=True)
+    # both lists are already newest-first, so merge instead of re-sorting the whole digest
+    seen = set()
+    items = []
+    for item in heapq.merge(new_items, digest["items"], key=lambda x: x["post_date"], reverse=True):
+        if item["post_date"] < cut_off:
+            break
+        if item["id"] in seen:
+            continue
+        seen.add(item["id"])
+        items.append(item)
+    digest["items"] = items
+    _save_digest(digest)
+    if sort == "relevance":
+        return _by_relevance(items)
+    return items
+
+
+def _by_relevance(items):
+    scores = score_texts([f"{item['title'] or ''}\n{_summary_text(item['summary'])}" for item in items])
+    scored = [{**item, "relevance": score} for item, score in zip(items, scores)]
+    return sorted(scored, key=lambda x: x["relevance"], reverse=True)
+
+
+def _summary_text(summary) -> str:
+    if isinstance(summary, dict):
+        return summary.get("full_summary") or summary.get("full") or summary.get("short_summary") or ""
+    return str(summary or "")
+
+
+def _load_digest() -> dict:
+    if DIGEST_PATH.exists():
+        return json.loads(DIGEST_PATH.read_text())
+    return {"watermarks": {}, "items": []}
+
+
+def _save_digest(digest: dict) -> None:
+    tmp_path = DIGEST_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(digest))
+    tmp_path.replace(DIGEST_PATH)
+
+
+def _build_list(newsletters, cut_off, watermarks):
+    # returns a list of dicts for posts newer than each newsletter's watermark, where each dict contains
+    # the id, title, url, post_date and summary; watermarks is updated in place
+    with ThreadPoolExecutor(max_workers=BUILD_LIST_CONCURRENCY, thread_name_prefix="build_list") as pool:
+        listings = list(pool.map(lambda url: _new_posts(url, cut_off, watermarks.get(url, "")), newsletters))
+        jobs = [(newsletter_url, metadata) for newsletter_url, posts in zip(newsletters, listings) for metadata in posts or []]
+        items = list(pool.map(lambda job: _summarize_post(job[1]), jobs))
+    failed = {newsletter_url for newsletter_url, posts in zip(newsletters, listings) if posts is None}
+    failed.update(job[0] for job, item in zip(jobs, items) if item is None)
+    for newsletter_url, metadata in jobs:
+        # only move a newsletter's watermark once all of its new posts made it into the digest
+        if newsletter_url not in failed:
+            watermarks[newsletter_url] = max(watermarks.get(newsletter_url, ""), metadata.get("post_date"))
+    return [item for item in items if item is not None]
+
+
+def _new_posts(newsletter_url, cut_off, watermark):
+    """Return archive metadata for recent posts newer than watermark, or None if listing failed."""
+    try:
+        rv = []
+        for metadata in get_archive_posts(newsletter_url, 7):
+            post_date = metadata.get("post_date") or ""
+            if post_date[:10] < cut_off or post_date <= watermark:
                 continue
-            article_text = get_article(post.url)
-            summary = summarize_article(metadata.get("id"), article_text)
-            list.append({
-                "id": metadata.get("id"),
-                "title": metadata.get("title"),
-                "url": post.url,
-                "post_date": post_date,
-                "summary": summary
-            })
-    return list
+            rv.append(metadata)
+        return rv
+    except Exception as e:
+        print(f"build_list: failed to list {newsletter_url}: {e}")
+        return None
+
+
+def _summarize_post(metadata):
+    url = metadata.get("canonical_url")
+    try:
+        article_text = get_article(url)
+        with llm_route("build_list"):
+            summary = summarize_article(metadata.get("id"), article_text, aliases=(summary_id_for_url(url),) if url else ())
+    except Exception as e:
+        print(f"build_list: failed {url}: {e}")
+        return None
+    return {
+        "id": metadata.get("id"),
+        "title": metadata.get("title"),
+        "url": url,
+        "post_date": metadata.get("post_date")[:10],
+        "summary": summary,
+    }
@@ -0,0 +1,141 @@
+"""Tiered key/value cache used for titles, summaries, article content and post lists.
+
+Lookups go memory LRU -> local content store (content_store.py, one SQLite file) -> optional shared
+store, and hits are copied into the faster tiers. Values must be JSON-serializable. Entries carry
+optional TTLs, and each tier evicts by size.
+
+The memory tier only answers for MEMORY_TTL_SECONDS after an entry was loaded or written (and never for
+an expired entry); after that the lookup goes back to the store, so a value another worker wrote is
+picked up within that window. Pass use_memory=False to read the store directly, e.g. for the re-check
+a single_flight waiter does after another worker computed the value.
+
+Set CACHE_SHARED_DB to a second SQLite file path to add the shared tier (e.g. a path on a volume shared
+by several hosts' workers).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from content_store import CacheEntry, get_store
+
+CACHE_SHARED_DB = os.environ.get("CACHE_SHARED_DB")
+DEFAULT_MAX_ITEMS = 1024
+DEFAULT_MAX_MEMORY_BYTES = 32 * 1024 * 1024
+MEMORY_TTL_SECONDS = float(os.environ.get("CACHE_MEMORY_TTL_SECONDS", 5))
+
+_DEFAULT = object()
+
+
+class MemoryTier:
+    """Thread-safe LRU bounded by item count and (approximate, serialized) size.
+
+    Entries are only returned for ttl seconds after they were set, and not once they have expired.
+    """
+
+    def __init__(self, max_items: int, max_bytes: int, ttl: float = MEMORY_TTL_SECONDS):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[CacheEntry, int, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CacheEntry | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[0].expired or time.monotonic() - item[2] >= self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        size = len(json.dumps(entry.value))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (entry, size, time.monotonic())
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_items or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+
+class Cache:
+    """A named cache: memory LRU in front of the content store, plus the shared store when CACHE_SHARED_DB is set.
+
+    ttl (seconds) is the default lifetime of entries; None keeps them until evicted for size.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float | None = None,
+        max_items: int = DEFAULT_MAX_ITEMS,
+        max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.memory = MemoryTier(max_items, max_memory_bytes)
+        self.store = get_store()
+        self.shared = get_store(CACHE_SHARED_DB) if CACHE_SHARED_DB else None
+
+    def get(self, key: str, use_memory: bool = True) -> Any:
+        """Return the cached value, or None if missing or expired."""
+        entry = self.get_entry(key, use_memory)
+        if entry is None or entry.expired:
+            return None
+        return entry.value
+
+    def get_entry(self, key: str, use_memory: bool = True) -> CacheEntry | None:
+        """Return the CacheEntry for key even if it has expired (for revalidation / stale-while-revalidate)."""
+        return self.get_entries([key], use_memory).get(key)
+
+    def get_entries(self, keys: list[str], use_memory: bool = True) -> dict[str, CacheEntry]:
+        """Bulk get_entry: one query per lower tier for all keys missing from memory."""
+        rv = {}
+        missing = []
+        for key in keys:
+            entry = self.memory.get(key) if use_memory else None
+            if entry is not None:
+                rv[key] = entry
+            else:
+                missing.append(key)
+        if missing:
+            found = self.store.get_many(self.name, missing)
+            still_missing = [key for key in missing if key not in found]
+            if still_missing and self.shared is not None:
+                from_shared = self.shared.get_many(self.name, still_missing)
+                if from_shared:
+                    self.store.set_many(self.name, from_shared)
+                found.update(from_shared)
+            for key, entry in found.items():
+                self.memory.set(key, entry)
+            rv.update(found)
+        return rv
+
+    def set(self, key: str, value: Any, ttl: float | None = _DEFAULT) -> CacheEntry:
+        if ttl is _DEFAULT:
+            ttl = self.ttl
+        now = time.time()
+        entry = CacheEntry(value, now, now + ttl if ttl is not None else None)
+        self.store.set(self.name, key, entry)
+        if self.shared is not None:
+            self.shared.set(self.name, key, entry)
+        self.memory.set(key, entry)
+        return entry
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        self.store.delete(self.name, key)
+        if self.shared is not None:
+            self.shared.delete(self.name, key)
@@ -0,0 +1,217 @@
+"""Compact on-disk store for cached article text, summaries, titles and post lists.
+
+All entries live in one SQLite database in WAL mode (readers never block the writer, and every gunicorn
+worker can open it), keyed by (namespace, key), with zlib-compressed JSON payloads. This replaces the old
+one-file-per-item directories (cache/, content_cache/, title_cache/, cache_store/), which cost a stat plus
+an open per lookup and grew to hundreds of thousands of files.
+
+    python content_store.py migrate [--delete]   # one-shot import of the old cache directories
+    python content_store.py compact              # drop expired/oldest entries and reclaim space
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, NamedTuple
+
+CONTENT_STORE_PATH = Path(os.environ.get("CONTENT_STORE_PATH", Path(__file__).parent / "content_store.db"))
+CONTENT_STORE_MAX_BYTES = int(os.environ.get("CONTENT_STORE_MAX_BYTES", 1024 * 1024 * 1024))
+COMPACT_CHECK_EVERY_WRITES = 1000
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+_BULK_GET_BATCH = 500  # stay below SQLite's bound-parameter limit
+# namespaces nothing reads any more; migrate skips them and compact deletes what is left of them
+RETIRED_NAMESPACES = ("content", "summaries")
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    stored_at: float  # time.time() when the value was stored
+    expires_at: float | None  # time.time() after which the entry is stale; None = never
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+
+def _pack(entry: CacheEntry) -> bytes:
+    return zlib.compress(json.dumps(entry.value).encode())
+
+
+def _unpack(data: bytes, stored_at: float, expires_at: float | None) -> CacheEntry:
+    return CacheEntry(json.loads(zlib.decompress(data)), stored_at, expires_at)
+
+
+class ContentStore:
+    """(namespace, key) -> CacheEntry in a single SQLite file; safe to share between threads and processes."""
+
+    def __init__(self, path: Path | str, max_bytes: int = CONTENT_STORE_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE_BYTES}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (namespace TEXT NOT NULL, key TEXT NOT NULL, data BLOB NOT NULL,"
+                " size INTEGER NOT NULL, stored_at REAL NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> CacheEntry | None:
+        row = self._conn().execute(
+            "SELECT data, stored_at, expires_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return _unpack(*row) if row else None
+
+    def get_many(self, namespace: str, keys: list[str]) -> dict[str, CacheEntry]:
+        """Return { key: CacheEntry } for the keys that are present, in as few queries as possible."""
+        rv = {}
+        keys = list(dict.fromkeys(keys))
+        for start in range(0, len(keys), _BULK_GET_BATCH):
+            batch = keys[start:start + _BULK_GET_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            rows = self._conn().execute(
+                f"SELECT key, data, stored_at, expires_at FROM entries WHERE namespace = ? AND key IN ({placeholders})",
+                (namespace, *batch),
+            )
+            for key, data, stored_at, expires_at in rows:
+                rv[key] = _unpack(data, stored_at, expires_at)
+        return rv
+
+    def set(self, namespace: str, key: str, entry: CacheEntry) -> None:
+        self.set_many(namespace, {key: entry})
+
+    def set_many(self, namespace: str, entries: dict[str, CacheEntry]) -> None:
+        conn = self._conn()
+        rows = []
+        for key, entry in entries.items():
+            data = _pack(entry)
+            rows.append((namespace, key, data, len(data), entry.stored_at, entry.expires_at))
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (namespace, key, data, size, stored_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        with self._lock:
+            before = self._writes
+            self._writes += len(rows)
+            check = self._writes // COMPACT_CHECK_EVERY_WRITES != before // COMPACT_CHECK_EVERY_WRITES
+        if check:
+            self.compact(vacuum=False)
+
+    def delete(self, namespace: str, key: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def compact(self, vacuum: bool = True) -> None:
+        """Drop expired and retired entries, then the oldest ones until under max_bytes; optionally VACUUM the file."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+            conn.executemany("DELETE FROM entries WHERE namespace = ?", [(namespace,) for namespace in RETIRED_NAMESPACES])
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                rows = conn.execute("SELECT namespace, key, size FROM entries ORDER BY stored_at").fetchall()
+                doomed = []
+                for namespace, key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((namespace, key))
+                    total -= size
+                conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", doomed)
+        if vacuum:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+_STORES: dict[Path, ContentStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_store(path: Path | str = CONTENT_STORE_PATH) -> ContentStore:
+    """Return the process-wide ContentStore for path."""
+    path = Path(path)
+    with _STORES_LOCK:
+        store = _STORES.get(path)
+        if store is None:
+            store = _STORES[path] = ContentStore(path)
+    return store
+
+
+def migrate_legacy_dirs(store: ContentStore, delete: bool = False) -> dict[str, int]:
+    """Import the one-file-per-item cache directories into store; return the number of entries per namespace."""
+    root = Path(__file__).parent
+    counts = {}
+
+    def load(namespace: str, entries: dict[str, CacheEntry], paths: list[Path]) -> None:
+        if entries:
+            store.set_many(namespace, entries)
+        counts[namespace] = counts.get(namespace, 0) + len(entries)
+        if delete:
+            for path in paths:
+                path.unlink(missing_ok=True)
+
+    # title_cache/<sha256(url)>.json: { result, etag, ... } or, in older files, the bare result
+    entries, paths = {}, []
+    for path in (root / "title_cache").glob("*.json"):
+        data = json.loads(path.read_text())
+        if "result" not in data:
+            data = {"result": data, "etag": None, "last_modified": None, "max_age": None}
+        entries[path.stem] = CacheEntry(data, path.stat().st_mtime, None)
+        paths.append(path)
+    load("titles", entries, paths)
+
+    # cache/<id>.txt summaries are not imported: summaries are keyed by article content now
+    # (summarize_article.summary_key), which the old files don't record
+
+    # content_cache/<post_id>.txt article text is not imported either: articles are cached by URL
+    # (context.fetch_article), and the files only carry a post id
+
+    # cache_store/<namespace>/<sha256(key)>.json: { key, value, stored_at, expires_at }
+    for directory in (root / "cache_store").glob("*"):
+        if not directory.is_dir() or directory.name in RETIRED_NAMESPACES:
+            continue
+        entries, paths = {}, []
+        for path in directory.glob("*.json"):
+            raw = json.loads(path.read_text())
+            entries[raw["key"]] = CacheEntry(raw["value"], raw["stored_at"], raw["expires_at"])
+            paths.append(path)
+        load(directory.name, entries, paths)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the SQLite content store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser(
+        "migrate",
+        help="import the old one-file-per-item cache directories (old summaries and article text are not imported)",
+    )
+    migrate.add_argument("--delete", action="store_true", help="remove the old files once imported")
+    subparsers.add_parser("compact", help="drop expired/oldest entries and VACUUM")
+    args = parser.parse_args()
+    store = get_store()
+    if args.command == "migrate":
+        for namespace, count in migrate_legacy_dirs(store, delete=args.delete).items():
+            print(f"{namespace}: {count} entries")
+    else:
+        store.compact()
+
+
+if __name__ == "__main__":
+    main()
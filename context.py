@@ -1,68 +1,137 @@
-import os
-from pathlib import Path
-from urllib.error import HTTPError
-from urllib.parse import urljoin
-from urllib.request import HTTPRedirectHandler, Request, build_opener
+import hashlib
 import json
-from groq import Groq
 
-from htmlstripper import _strip_html
-from summarize_article import summarize_article
+import itertools
 
-REDIRECT_CODES = (301, 302, 303, 307, 308)
+from cache import Cache
+from fetch import conditional_headers, fetch_stream, get_validators, is_fresh, merge_validators
+from context_index import context_version, get_context_version, index_for, load_context
+from get_title import cache_title, title_result
+from llm import get_client
+from htmlstripper import extract_page
+from singleflight import single_flight
+from summarize_article import summarize_article, summary_id_for_url
 
+MAX_ARTICLE_BYTES = 4 * 1024 * 1024  # bytes read off the wire per article
+MAX_ARTICLE_CHARS = 200_000  # characters of extracted text kept per article
 
-class NoRedirectHandler(HTTPRedirectHandler):
-    """Handler that does not follow redirects; the caller will recurse."""
 
-    def redirect_request(self, req, fp, code, msg, headers, newurl):
-        return None
+def get_article(url, redirect_limit=10, main_content=True):
+    """Fetch the contents at url through the shared pooled fetcher, following redirects; return the text."""
+    return fetch_article(url, redirect_limit, main_content)["text"]
 
 
-def get_article(url, redirect_limit=10):
-    """Fetch the contents at url. If the server responds with a redirect, follow it recursively."""
-    if redirect_limit <= 0:
-        raise ValueError("Too many redirects")
-    opener = build_opener(NoRedirectHandler())
-    req = Request(url, headers={"User-Agent": "Mozilla/5.0 (compatible; get_article/1.0)"})
-    try:
-        resp = opener.open(req)
-    except HTTPError as e:
-        if e.code in REDIRECT_CODES:
-            location = e.headers.get("Location")
-            if location:
-                next_url = urljoin(url, location)
-                return get_article(next_url, redirect_limit - 1)
-        raise
-    raw = resp.read().decode(errors="replace")
-    if "<" in raw and ">" in raw:
-        return _strip_html(raw)
-    return raw
+def fetch_article(url, redirect_limit=10, main_content=True) -> dict:
+    """Return { text, title, author, subtitle, post_date } for url, from the article cache when it is fresh.
+
+    A miss downloads the page once: the body is streamed straight into the HTML stripper, which stops
+    reading at the end of the post body container or </body> (or MAX_ARTICLE_CHARS of text, or
+    MAX_ARTICLE_BYTES off the wire), so memory stays flat for any page size. With main_content (the
+    default) only the post body is returned, not nav, subscribe prompts or comments. The page's title is
+    stored in get_title's cache too, so a get_title(url) afterwards needs no download. A stale entry is
+    revalidated with its ETag / Last-Modified and kept on 304 Not Modified.
+
+    subtitle is the post's description and post_date its publish date ("yyyy-mm-dd"); fields the page
+    doesn't provide are "" (title, post_date) or None.
+    """
+    key = _article_key(url, main_content)
+    article = _read_fresh_article(key)
+    if article is not None:
+        return dict(article)
+
+    def refresh():
+        cached = _ARTICLE_CACHE.get_entry(key)
+        entry = _download_article(url, redirect_limit, main_content, cached.value if cached else None)
+        _ARTICLE_CACHE.set(key, entry)
+        return entry["article"]
+
+    return dict(single_flight(f"article:{key}", refresh, cached=lambda: _read_fresh_article(key, use_memory=False)))
+
+
+def get_cached_article(url, main_content=True) -> dict | None:
+    """Return the stored fetch_article result for url however old it is, or None; never makes a request."""
+    entry = _ARTICLE_CACHE.get(_article_key(url, main_content))
+    return dict(entry["article"]) if entry is not None else None
+
+
+def cache_article(url, article: dict, validators: dict | None = None, main_content=True) -> None:
+    """Store an article obtained some other way (e.g. Substack's post API) as the fetch_article result for url."""
+    fields = {"text": "", "title": "", "author": None, "subtitle": None, "post_date": ""}
+    _ARTICLE_CACHE.set(_article_key(url, main_content), {"article": {**fields, **article}, **(validators or {})})
+
+
+# "<summary_id_for_url(url)>:main|page" -> { article: fetch_article result, etag, last_modified, max_age };
+# freshness is judged from the entry's stored_at
+_ARTICLE_CACHE = Cache("articles", max_items=512)
+
+
+def _article_key(url: str, main_content: bool) -> str:
+    # summary ids normalize the URL (scheme, host case, trailing slash, tracking params)
+    return f"{summary_id_for_url(url)}:{'main' if main_content else 'page'}"
+
+
+def _read_fresh_article(key: str, use_memory: bool = True) -> dict | None:
+    cached = _ARTICLE_CACHE.get_entry(key, use_memory)
+    if cached is not None and is_fresh(cached.value, cached.stored_at):
+        return cached.value["article"]
+    return None
+
+
+def _download_article(url, redirect_limit, main_content, cached: dict | None) -> dict:
+    """Fetch url and return a cache entry { article, etag, last_modified, max_age }, conditionally if cached."""
+    headers = {"User-Agent": "Mozilla/5.0 (compatible; get_article/1.0)"}
+    headers.update(conditional_headers(cached))
+    with fetch_stream(url, headers=headers, redirect_limit=redirect_limit) as resp:
+        validators = get_validators(resp)
+        if resp.status == 304 and cached is not None:
+            for _ in resp.iter_bytes():
+                pass
+            return {"article": cached["article"], **merge_validators(validators, cached)}
+        chunks = resp.iter_text(max_bytes=MAX_ARTICLE_BYTES)
+        first = next(chunks, "")
+        if "html" in (resp.headers.get("Content-Type") or "") or "<" in first:
+            text, page = extract_page(itertools.chain([first], chunks), max_chars=MAX_ARTICLE_CHARS, main_content=main_content)
+            title_info = title_result(page["raw_title"], page["tagline"])
+            cache_title(url, title_info, validators)
+            article = {
+                "text": text,
+                "title": title_info["title"],
+                "author": title_info["author"] or page["author"],
+                "subtitle": page["description"],
+                "post_date": (page["published"] or "")[:10],
+            }
+            return {"article": article, **validators}
+        parts = []
+        size = 0
+        for chunk in itertools.chain([first], chunks):
+            parts.append(chunk[:MAX_ARTICLE_CHARS - size])
+            size += len(parts[-1])
+            if size >= MAX_ARTICLE_CHARS:
+                break
+        article = {"text": "".join(parts), "title": "", "author": None, "subtitle": None, "post_date": ""}
+        return {"article": article, **validators}
 
 
 def get_context():
-    me_dir = Path(__file__).parent / "me"
-    content_by_name = {}
-    for path in me_dir.iterdir():
-        if path.is_file():
-            key = path.stem  # root name (filename without extension)
-            content_by_name[key] = path.read_text()
-    return content_by_name
+    """Return { name: text } for the files in me/ (loaded once, re-read when a file changes; do not modify)."""
+    return load_context()
 
 
 GROQ_MODEL = "llama-3.3-70b-versatile"
+CONTEXT_TOP_K_PASSAGES = 8  # context passages (of up to context_index.PASSAGE_MAX_WORDS words) per prompt
+ANALYSIS_PROMPT_VERSION = "1"  # bump when the relate_article_to_context prompt changes
+
+_ANALYSIS_CACHE = Cache("relevance_analyses", max_items=1024)
 
 
 def relate_article_to_context(article_text: str, context: dict, *, model: str = GROQ_MODEL) -> str:
     """Use a Groq model to determine if any aspects of the article relate to the context.
-    context is a dict of name -> text (e.g. from get_context()).
+    context is a dict of name -> text (e.g. from get_context()); only its CONTEXT_TOP_K_PASSAGES passages
+    most relevant to the article (BM25, see context_index.py) go into the prompt.
     Returns the model's analysis as a string.
     """
-    api_key = os.environ.get("GROQ_API_KEY")
-    if not api_key:
-        raise ValueError("GROQ_API_KEY environment variable is not set")
-
-    context_blob = "\n\n".join(f"## {name}\n{text}" for name, text in context.items())
+    passages = index_for(context).search(article_text, CONTEXT_TOP_K_PASSAGES)
+    context_blob = "\n\n".join(f"## {name}\n{passage}" for name, passage in passages)
     prompt = f"""You are given:
 1) An article (below under ARTICLE).
 2) Context: several named text sources (below under CONTEXT).
@@ -82,14 +151,28 @@ ARTICLE:
 {article_text}
 """
 
-    client = Groq(api_key=api_key)
-    completion = client.chat.completions.create(
-        messages=[
+    return get_client().complete(
+        [
             {"role": "system", "content": "You analyze whether an article relates to given context. Be precise and concise."},
             {"role": "user", "content": prompt},
         ],
-        model=model,
+        model,
         temperature=0.2,
         max_tokens=1024,
     )
-    return completion.choices[0].message.content or ""
+
+
+def relate_article_to_context_cached(article_text: str, context: dict, *, model: str = GROQ_MODEL) -> tuple[str, bool]:
+    """relate_article_to_context, cached by article text + context version + model + prompt version.
+
+    Returns (analysis, cached).
+    """
+    version = get_context_version() if context is load_context() else context_version(context)
+    normalized = " ".join(article_text.split())
+    key = hashlib.sha256(f"{model}\0{ANALYSIS_PROMPT_VERSION}\0{version}\0{normalized}".encode()).hexdigest()
+    analysis = _ANALYSIS_CACHE.get(key)
+    if analysis is not None:
+        return analysis, True
+    analysis = relate_article_to_context(article_text, context, model=model)
+    _ANALYSIS_CACHE.set(key, analysis)
+    return analysis, False
@@ -0,0 +1,188 @@
+"""Personal context (the files in me/) loaded once, chunked into passages and indexed with BM25.
+
+load_context() re-reads me/ only when a file's mtime or size changes. get_context_index() returns the BM25
+index over the current context, persisted in CONTEXT_INDEX_PATH under the context's version (a hash of its
+content), so a restart only re-tokenizes when me/ actually changed. relate_article_to_context sends just
+the top passages for an article instead of the whole of me/, which keeps the prompt bounded as me/ grows.
+"""
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+
+CONTEXT_DIR = Path(__file__).parent / "me"
+CONTEXT_INDEX_PATH = Path(__file__).parent / "context_index.json"
+PASSAGE_MAX_WORDS = 120
+BM25_K1 = 1.5
+BM25_B = 0.75
+MAX_QUERY_TERMS = 200  # most frequent article terms used as the query
+
+STOPWORDS = frozenset(
+    """a about after all also an and any are as at be because been but by can could did do does for from had
+    has have he her his how i if in into is it its just me more most my no not of on one or our out she so
+    than that the their them then there these they this to too up us was we were what when which who will
+    with would you your""".split()
+)
+_WORD_RE = re.compile(r"\w+")
+
+_LOCK = threading.Lock()
+_context: dict[str, str] | None = None
+_context_signature = None
+_context_version = ""
+_index: "ContextIndex | None" = None
+_adhoc_index: "ContextIndex | None" = None  # last index built for a context other than me/
+
+
+def tokenize(text: str) -> list[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS and not w.isdigit()]
+
+
+def context_version(context: dict[str, str]) -> str:
+    """Content hash of a context dict; changes whenever any source text changes."""
+    return hashlib.sha256(json.dumps(sorted(context.items())).encode()).hexdigest()[:16]
+
+
+def _split_passages(text: str, max_words: int = PASSAGE_MAX_WORDS) -> list[str]:
+    """Pack paragraphs into passages of up to max_words words; longer paragraphs are cut by words."""
+    passages = []
+    current = []
+    for paragraph in text.splitlines():
+        words = paragraph.split()
+        while len(words) > max_words:
+            if current:
+                passages.append(" ".join(current))
+                current = []
+            passages.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        if current and len(current) + len(words) > max_words:
+            passages.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class ContextIndex:
+    """BM25 over the passages of a context dict."""
+
+    def __init__(self, version: str, passages: list[tuple[str, str]], lengths: list[int], postings: dict[str, list[tuple[int, int]]]):
+        self.version = version
+        self.passages = passages  # [(source name, passage text)]
+        self.lengths = lengths  # tokens per passage
+        self.postings = postings  # term -> [(passage index, term frequency)]
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    @classmethod
+    def build(cls, context: dict[str, str]) -> "ContextIndex":
+        passages = [(name, passage) for name, text in sorted(context.items()) for passage in _split_passages(text)]
+        lengths = []
+        postings: dict[str, list[tuple[int, int]]] = {}
+        for i, (_, passage) in enumerate(passages):
+            counts = Counter(tokenize(passage))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((i, tf))
+        return cls(context_version(context), passages, lengths, postings)
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.passages) - df + 0.5) / (df + 0.5))
+
+    def search(self, text: str, k: int) -> list[tuple[str, str]]:
+        """Return the k passages most relevant to text, best first, as (source name, passage)."""
+        query = [term for term, _ in Counter(tokenize(text)).most_common(MAX_QUERY_TERMS)]
+        scores: dict[int, float] = {}
+        for term in query:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for i, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.avg_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [self.passages[i] for i in best]
+
+    def to_json(self) -> dict:
+        return {"version": self.version, "passages": self.passages, "lengths": self.lengths, "postings": self.postings}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "ContextIndex":
+        return cls(
+            data["version"],
+            [tuple(p) for p in data["passages"]],
+            data["lengths"],
+            {term: [tuple(p) for p in postings] for term, postings in data["postings"].items()},
+        )
+
+
+def _signature() -> tuple:
+    if not CONTEXT_DIR.is_dir():
+        return ()
+    return tuple(
+        sorted((path.name, stat.st_mtime_ns, stat.st_size) for path in CONTEXT_DIR.iterdir() if path.is_file() for stat in [path.stat()])
+    )
+
+
+def _load() -> tuple[dict[str, str], str]:
+    global _context, _context_signature, _context_version
+    signature = _signature()
+    with _LOCK:
+        if _context is None or signature != _context_signature:
+            _context = {path.stem: path.read_text() for path in sorted(CONTEXT_DIR.iterdir()) if path.is_file()} if signature else {}
+            _context_signature = signature
+            _context_version = context_version(_context)
+        return _context, _context_version
+
+
+def load_context() -> dict[str, str]:
+    """Return { file stem: text } for me/, re-reading the files only after one of them changed."""
+    return _load()[0]
+
+
+def get_context_version() -> str:
+    """Version (content hash) of the current me/ context."""
+    return _load()[1]
+
+
+def get_context_index() -> ContextIndex:
+    """Return the BM25 index of the current me/ context, loading it from disk or rebuilding it if me/ changed."""
+    global _index
+    context, version = _load()
+    with _LOCK:
+        if _index is not None and _index.version == version:
+            return _index
+        index = None
+        if CONTEXT_INDEX_PATH.exists():
+            try:
+                data = json.loads(CONTEXT_INDEX_PATH.read_text())
+                if data.get("version") == version:
+                    index = ContextIndex.from_json(data)
+            except (ValueError, KeyError):
+                index = None
+        if index is None:
+            index = ContextIndex.build(context)
+            tmp_path = CONTEXT_INDEX_PATH.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(index.to_json()))
+            tmp_path.replace(CONTEXT_INDEX_PATH)
+        _index = index
+        return index
+
+
+def index_for(context: dict[str, str]) -> ContextIndex:
+    """Return an index for context: the persisted me/ index when context is the me/ context, else one built in memory."""
+    global _adhoc_index
+    if context is _context:
+        return get_context_index()
+    version = context_version(context)
+    index = get_context_index()
+    if index.version == version:
+        return index
+    with _LOCK:
+        if _adhoc_index is None or _adhoc_index.version != version:
+            _adhoc_index = ContextIndex.build(context)
+        return _adhoc_index
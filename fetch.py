@@ -0,0 +1,375 @@
+"""Shared HTTP fetch layer: per-host keep-alive connection pools, redirects, gzip/brotli and timeouts.
+
+Every outbound page/API request (get_article, get_title, Substack listings) goes through fetch() so that
+repeated requests to the same *.substack.com hosts reuse an open TCP+TLS connection instead of paying a
+fresh handshake per request and per redirect hop.
+"""
+import codecs
+import gzip
+import http.client
+import io
+import json
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it (a trimmed install) we only advertise gzip/deflate
+    brotli = None
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+USER_AGENT = "Mozilla/5.0 (compatible; digital-me/1.0)"
+DEFAULT_TIMEOUT_SECONDS = 10
+MAX_CONNECTIONS_PER_HOST = 4
+IDLE_CONNECTION_MAX_AGE_SECONDS = 60
+STREAM_CHUNK_SIZE = 16 * 1024
+# freshness of a stored response when the server sends no max-age, or no ETag / Last-Modified to revalidate with
+CACHE_MAX_AGE_SECONDS = 24 * 60 * 60
+MIN_CACHE_MAX_AGE_SECONDS = 5 * 60  # floor for max-age=0 / no-cache so validators are not checked on every call
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli is not None else "gzip, deflate"
+
+# Errors that mean a reused keep-alive connection was closed by the server; the request is retried once
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, BrokenPipeError, ConnectionResetError)
+
+
+class Response:
+    """A fully read HTTP response. body is the decoded (decompressed) payload."""
+
+    def __init__(self, url: str, status: int, reason: str, headers, body: bytes):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def text(self) -> str:
+        charset = self.headers.get_content_charset() if hasattr(self.headers, "get_content_charset") else None
+        try:
+            return self.body.decode(charset or "utf-8", errors="replace")
+        except LookupError:
+            return self.body.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.text())
+
+
+class _HostPool:
+    """Keep-alive connections to one (scheme, host, port); at most max_connections in use at once."""
+
+    def __init__(self, scheme: str, netloc: str, max_connections: int):
+        self.scheme = scheme
+        self.netloc = netloc
+        self._idle: list[tuple[http.client.HTTPConnection, float]] = []
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_connections)
+
+    def acquire(self, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        """Return (connection, reused). Blocks up to timeout for a free slot."""
+        if not self._semaphore.acquire(timeout=timeout):
+            raise TimeoutError(f"Timed out waiting for a connection to {self.netloc}")
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if now - last_used < IDLE_CONNECTION_MAX_AGE_SECONDS:
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        if self.scheme == "https":
+            conn = http.client.HTTPSConnection(self.netloc, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(self.netloc, timeout=timeout)
+        return conn, False
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool) -> None:
+        try:
+            if reusable:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+            else:
+                conn.close()
+        finally:
+            self._semaphore.release()
+
+
+_POOLS: dict[tuple[str, str], _HostPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _get_pool(scheme: str, netloc: str) -> _HostPool:
+    key = (scheme, netloc.lower())
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = _HostPool(scheme, netloc, MAX_CONNECTIONS_PER_HOST)
+    return pool
+
+
+def _decode_body(body: bytes, encoding: str | None) -> bytes:
+    encoding = (encoding or "").strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    if encoding == "br" and brotli is not None:
+        return brotli.decompress(body)
+    return body
+
+
+class _BrotliDecoder:
+    unconsumed_tail = b""
+
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, data: bytes, max_length: int = 0) -> bytes:
+        return self._decompressor.process(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def _incremental_decoder(encoding: str | None):
+    """Return a zlib.decompressobj-like decoder for a Content-Encoding, or None for identity."""
+    encoding = (encoding or "").strip().lower()
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompressobj()
+    if encoding == "br" and brotli is not None:
+        return _BrotliDecoder()
+    return None
+
+
+class StreamingResponse:
+    """A response whose body is read from the socket incrementally.
+
+    Use through fetch_stream(); closing returns the connection to the pool if the body was read to the end,
+    and discards it otherwise.
+    """
+
+    def __init__(self, url: str, pool: "_HostPool", conn: http.client.HTTPConnection, resp: http.client.HTTPResponse):
+        self.url = url
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = resp.headers
+        self._pool = pool
+        self._conn = conn
+        self._resp = resp
+        self._closed = False
+
+    def iter_bytes(self, chunk_size: int = STREAM_CHUNK_SIZE, max_bytes: int | None = None):
+        """Yield decompressed body chunks, reading at most max_bytes from the wire."""
+        decoder = _incremental_decoder(self.headers.get("Content-Encoding"))
+        read = 0
+        while max_bytes is None or read < max_bytes:
+            size = chunk_size if max_bytes is None else min(chunk_size, max_bytes - read)
+            chunk = self._resp.read(size)
+            if not chunk:
+                break
+            read += len(chunk)
+            if decoder is None:
+                yield chunk
+                continue
+            # cap each decompressed piece at chunk_size so a highly compressed body can't balloon in memory
+            data = decoder.decompress(chunk, chunk_size)
+            while data:
+                yield data
+                data = decoder.decompress(decoder.unconsumed_tail, chunk_size) if decoder.unconsumed_tail else b""
+        if decoder is not None:
+            tail = decoder.flush()
+            if tail:
+                yield tail
+
+    def iter_text(self, chunk_size: int = STREAM_CHUNK_SIZE, max_bytes: int | None = None):
+        """Like iter_bytes, decoded with the response charset (default utf-8)."""
+        try:
+            decoder = codecs.getincrementaldecoder(self.headers.get_content_charset() or "utf-8")(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for chunk in self.iter_bytes(chunk_size, max_bytes):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        reusable = self._resp.isclosed() and not self._resp.will_close
+        if not reusable:
+            self._resp.close()
+        self._pool.release(self._conn, reusable)
+
+
+def _open(method: str, url: str, headers: dict, timeout: float) -> tuple[_HostPool, http.client.HTTPConnection, http.client.HTTPResponse]:
+    """Send the request on a pooled connection; return (pool, conn, resp) with the body still unread."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        raise ValueError(f"Unsupported URL: {url}")
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    pool = _get_pool(parts.scheme, parts.netloc)
+    for attempt in range(2):
+        conn, reused = pool.acquire(timeout)
+        try:
+            conn.request(method, path, headers=headers)
+            return pool, conn, conn.getresponse()
+        except _STALE_CONNECTION_ERRORS:
+            pool.release(conn, False)
+            if reused and attempt == 0:
+                continue
+            raise
+        except BaseException:
+            pool.release(conn, False)
+            raise
+    raise RuntimeError("unreachable")
+
+
+def _request_once(method: str, url: str, headers: dict, timeout: float) -> Response:
+    pool, conn, resp = _open(method, url, headers, timeout)
+    reusable = False
+    try:
+        body = resp.read()
+        reusable = not resp.will_close
+    finally:
+        pool.release(conn, reusable)
+    body = _decode_body(body, resp.getheader("Content-Encoding"))
+    return Response(url, resp.status, resp.reason, resp.headers, body)
+
+
+def fetch(
+    url: str,
+    headers: dict | None = None,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    redirect_limit: int = 10,
+    method: str = "GET",
+) -> Response:
+    """Fetch url over a pooled keep-alive connection, following redirects.
+
+    Raises urllib.error.HTTPError for 4xx/5xx responses (like urlopen) and ValueError on too many redirects.
+    """
+    request_headers = {"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING}
+    request_headers.update(headers or {})
+    for _ in range(redirect_limit):
+        resp = _request_once(method, url, request_headers, timeout)
+        location = resp.headers.get("Location")
+        if resp.status in REDIRECT_CODES and location:
+            url = urljoin(url, location)
+            if resp.status == 303:
+                method = "GET"
+            continue
+        if resp.status >= 400:
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(resp.body))
+        return resp
+    raise ValueError("Too many redirects")
+
+
+@contextmanager
+def fetch_stream(
+    url: str,
+    headers: dict | None = None,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    redirect_limit: int = 10,
+):
+    """Context manager version of fetch() for GET that yields a StreamingResponse.
+
+    The caller reads as much of the body as it needs; on exit the connection goes back to the pool (or is
+    dropped if the body was not read to the end).
+    """
+    request_headers = {"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING}
+    request_headers.update(headers or {})
+    for _ in range(redirect_limit):
+        pool, conn, resp = _open("GET", url, request_headers, timeout)
+        stream = StreamingResponse(url, pool, conn, resp)
+        location = resp.getheader("Location")
+        if (resp.status in REDIRECT_CODES and location) or resp.status >= 400:
+            try:
+                body = b"".join(stream.iter_bytes())
+            finally:
+                stream.close()
+            if resp.status >= 400:
+                raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(body))
+            url = urljoin(url, location)
+            continue
+        try:
+            yield stream
+        finally:
+            stream.close()
+        return
+    raise ValueError("Too many redirects")
+
+
+def fetch_json(url: str, headers: dict | None = None, timeout: float = DEFAULT_TIMEOUT_SECONDS):
+    """fetch() a JSON API endpoint and return the decoded payload."""
+    request_headers = {"Accept": "application/json"}
+    request_headers.update(headers or {})
+    return fetch(url, headers=request_headers, timeout=timeout).json()
+
+
+def get_validators(resp: Response) -> dict:
+    """Return the cache validators of resp: { etag, last_modified, max_age } (values None when absent).
+
+    max_age is the Cache-Control max-age in seconds, or 0 for no-cache/no-store.
+    """
+    cache_control = (resp.headers.get("Cache-Control") or "").lower()
+    max_age = None
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        max_age = 0
+    else:
+        match = re.search(r"(?:^|[,\s])max-age=(\d+)", cache_control)
+        if match:
+            max_age = int(match.group(1))
+    return {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "max_age": max_age,
+    }
+
+
+def is_fresh(validators: dict, stored_at: float) -> bool:
+    """Whether a response stored at stored_at (time.time()) with these validators can be used without revalidating.
+
+    The server's max-age (floored at MIN_CACHE_MAX_AGE_SECONDS) only applies when there is an ETag or
+    Last-Modified to revalidate cheaply with; otherwise a refresh is a full download, so CACHE_MAX_AGE_SECONDS.
+    """
+    revalidatable = validators.get("etag") or validators.get("last_modified")
+    if validators.get("max_age") is None or not revalidatable:
+        max_age = CACHE_MAX_AGE_SECONDS
+    else:
+        max_age = max(validators["max_age"], MIN_CACHE_MAX_AGE_SECONDS)
+    return time.time() - stored_at < max_age
+
+
+def merge_validators(validators: dict, cached: dict) -> dict:
+    """Validators for a 304 Not Modified, which may omit the stored ones that are still valid."""
+    return {
+        "etag": validators["etag"] or cached.get("etag"),
+        "last_modified": validators["last_modified"] or cached.get("last_modified"),
+        "max_age": validators["max_age"] if validators["max_age"] is not None else cached.get("max_age"),
+    }
+
+
+def conditional_headers(validators: dict | None) -> dict:
+    """Return If-None-Match / If-Modified-Since request headers for previously stored validators."""
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
@@ -1,23 +1,24 @@
 import hashlib
 import html
-import json
 import re
-import time
-from pathlib import Path
-from urllib.error import HTTPError, URLError
-from urllib.parse import urljoin
-from urllib.request import HTTPRedirectHandler, Request, build_opener
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
 
-REDIRECT_CODES = (301, 302, 303, 307, 308)
-TITLE_CACHE_DIR = Path(__file__).parent / "title_cache"
-CACHE_MAX_AGE_SECONDS = 24 * 60 * 60  # 24 hours
+from cache import Cache
+from fetch import conditional_headers, fetch, get_validators, is_fresh, merge_validators
+from singleflight import single_flight
 
+FETCH_TIMEOUT_SECONDS = 10
+TITLE_POOL_WORKERS = 16
+MAX_FETCHES_PER_HOST = 2
 
-class NoRedirectHandler(HTTPRedirectHandler):
-    """Handler that does not follow redirects; the caller will recurse."""
-
-    def redirect_request(self, req, fp, code, msg, headers, newurl):
-        return None
+_TITLE_POOL = ThreadPoolExecutor(max_workers=TITLE_POOL_WORKERS, thread_name_prefix="get_title")
+_HOST_SEMAPHORES: dict[str, threading.BoundedSemaphore] = {}
+_HOST_SEMAPHORES_LOCK = threading.Lock()
+# url -> Future for fetches that are queued or running in _TITLE_POOL
+_IN_FLIGHT: dict[str, Future] = {}
+_IN_FLIGHT_LOCK = threading.RLock()
 
 
 def _get_subtitle(html_str: str) -> str | None:
@@ -33,47 +34,142 @@ def _get_subtitle(html_str: str) -> str | None:
     return None
 
 
-def get_title(url: str, redirect_limit: int = 10) -> dict:
+def get_title(url: str, redirect_limit: int = 10, timeout: float = FETCH_TIMEOUT_SECONDS) -> dict:
     """Fetch the URL and return a dict with 'title', 'author' (if present), and 'subtitle' from the page.
-    Results are cached on disk; cache is refreshed if older than 24 hours.
+    Results are cached on disk together with the response's ETag / Last-Modified / max-age. A stale entry
+    is revalidated with a conditional GET; a 304 refreshes it without downloading or parsing the page.
     """
     # if url is missing the protocol, add https://
     if not url.startswith("http"):
         url = "https://" + url
 
-    cache_key = hashlib.sha256(url.encode()).hexdigest()
-    cache_path = TITLE_CACHE_DIR / f"{cache_key}.json"
-
-    if cache_path.exists():
-        age = time.time() - cache_path.stat().st_mtime
-        if age < CACHE_MAX_AGE_SECONDS:
-            return json.loads(cache_path.read_text())
-
-    result = _fetch_title(url, redirect_limit)
-    TITLE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    cache_path.write_text(json.dumps(result))
-    return result
-
-
-def _fetch_title(url: str, redirect_limit: int) -> dict:
-    if redirect_limit <= 0:
-        raise ValueError("Too many redirects")
-    opener = build_opener(NoRedirectHandler())
-    req = Request(url, headers={"User-Agent": "Mozilla/5.0 (compatible; get_title/1.0)"})
-    try:
-        resp = opener.open(req)
-    except HTTPError as e:
-        if e.code in REDIRECT_CODES:
-            location = e.headers.get("Location")
-            if location:
-                next_url = urljoin(url, location)
-                return _fetch_title(next_url, redirect_limit - 1)
-        raise
-    raw = resp.read().decode(errors="replace")
+    cache_key = _title_cache_key(url)
+    cached = _read_fresh_title(cache_key)
+    if cached is not None:
+        return cached
+    return single_flight(
+        f"title:{cache_key}",
+        lambda: _refresh_title(url, cache_key, redirect_limit, timeout),
+        cached=lambda: _read_fresh_title(cache_key, use_memory=False),
+    )
+
+
+def _title_cache_key(url: str) -> str:
+    if not url.startswith("http"):
+        url = "https://" + url
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def _read_fresh_title(cache_key: str, use_memory: bool = True) -> dict | None:
+    """Return the cached result if there is an entry for cache_key and it is still fresh, else None."""
+    return _fresh_result(_TITLE_CACHE.get_entry(cache_key, use_memory))
+
+
+def _fresh_result(cached) -> dict | None:
+    if cached is not None and is_fresh(cached.value, cached.stored_at):
+        return cached.value["result"]
+    return None
+
+
+def _refresh_title(url: str, cache_key: str, redirect_limit: int, timeout: float) -> dict:
+    cached = _TITLE_CACHE.get_entry(cache_key)
+    entry = _fetch_title(url, redirect_limit, timeout, cached.value if cached else None)
+    _TITLE_CACHE.set(cache_key, entry)
+    return entry["result"]
+
+
+# sha256(url) -> { result, etag, last_modified, max_age }; freshness is judged from the entry's stored_at
+_TITLE_CACHE = Cache("titles", max_items=4096)
+
+
+def _fetch_title(url: str, redirect_limit: int, timeout: float = FETCH_TIMEOUT_SECONDS, cached: dict | None = None) -> dict:
+    """Fetch url and return a cache entry { result, etag, last_modified, max_age }.
+
+    If cached carries validators they are sent as If-None-Match / If-Modified-Since, and on 304 Not Modified
+    the cached result is kept without reading the page.
+    """
+    headers = {"User-Agent": "Mozilla/5.0 (compatible; get_title/1.0)"}
+    headers.update(conditional_headers(cached))
+    resp = fetch(url, headers=headers, timeout=timeout, redirect_limit=redirect_limit)
+    validators = get_validators(resp)
+    if resp.status == 304 and cached is not None:
+        return {"result": cached["result"], **merge_validators(validators, cached)}
+    raw = resp.text()
     title_match = re.search(r"<title[^>]*>([\s\S]*?)</title>", raw, re.I)
     raw_title = html.unescape(title_match.group(1).strip()) if title_match else ""
+    return {"result": title_result(raw_title, _get_subtitle(raw)), **validators}
+
+
+def title_result(raw_title: str, subtitle: str | None) -> dict:
+    """Build get_title's { title, author, subtitle } from the page's <title> ("Title | Author | Site") and tagline."""
     parts = [p.strip() for p in raw_title.split("|")]
     title = parts[0] if parts else ""
     author = parts[1] if len(parts) >= 3 else None
-    subtitle = _get_subtitle(raw)
     return {"title": title, "author": author, "subtitle": subtitle}
+
+
+def cache_title(url: str, result: dict, validators: dict) -> None:
+    """Store a title result parsed elsewhere from a full download of url (e.g. context.fetch_article)."""
+    _TITLE_CACHE.set(_title_cache_key(url), {"result": result, **validators})
+
+
+def get_titles(urls: list[str], deadline: float = 3.0, timeout: float = FETCH_TIMEOUT_SECONDS) -> dict:
+    """Resolve titles for many URLs concurrently and return { url: get_title(url) } for those done by the deadline.
+
+    Fresh cached titles are answered in the calling thread from one bulk cache read, so they never queue
+    behind other callers' slow fetches. Only misses and stale entries go to a shared pool with at most
+    MAX_FETCHES_PER_HOST concurrent fetches per host, each bounded by timeout. URLs whose fetch failed map to
+    None; URLs still running are left out of the result and keep running in the background, so their title is
+    in the cache for the next call.
+    """
+    keys = {url: _title_cache_key(url) for url in dict.fromkeys(urls)}
+    entries = _TITLE_CACHE.get_entries(list(set(keys.values())))
+    results = {}
+    futures = {}
+    for url, key in keys.items():
+        result = _fresh_result(entries.get(key))
+        if result is not None:
+            results[url] = result
+        else:
+            futures[url] = _submit_title_fetch(url, timeout)
+    if futures:
+        wait(futures.values(), timeout=deadline)
+    for url, future in futures.items():
+        if not future.done():
+            continue
+        try:
+            results[url] = future.result()
+        except Exception:
+            results[url] = None
+    return results
+
+
+def _host_semaphore(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url if url.startswith("http") else "https://" + url).netloc.lower()
+    with _HOST_SEMAPHORES_LOCK:
+        semaphore = _HOST_SEMAPHORES.get(host)
+        if semaphore is None:
+            semaphore = _HOST_SEMAPHORES[host] = threading.BoundedSemaphore(MAX_FETCHES_PER_HOST)
+    return semaphore
+
+
+def _get_title_limited(url: str, timeout: float) -> dict:
+    with _host_semaphore(url):
+        return get_title(url, timeout=timeout)
+
+
+def _submit_title_fetch(url: str, timeout: float) -> Future:
+    """Return the in-flight Future for url, starting a fetch only if none is queued or running."""
+    with _IN_FLIGHT_LOCK:
+        future = _IN_FLIGHT.get(url)
+        if future is None:
+            future = _TITLE_POOL.submit(_get_title_limited, url, timeout)
+            _IN_FLIGHT[url] = future
+            future.add_done_callback(lambda f, url=url: _forget_in_flight(url, f))
+    return future
+
+
+def _forget_in_flight(url: str, future: Future) -> None:
+    with _IN_FLIGHT_LOCK:
+        if _IN_FLIGHT.get(url) is future:
+            del _IN_FLIGHT[url]
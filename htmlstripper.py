@@ -1,4 +1,6 @@
+import json
 from html.parser import HTMLParser
+from typing import Iterable
 
 # Tags to strip entirely (including their content)
 STRIP_WITH_CONTENT = frozenset(
@@ -6,45 +8,260 @@ STRIP_WITH_CONTENT = frozenset(
 )
 # Void/self-closing tags to strip (no content)
 STRIP_VOID = frozenset({"meta", "link", "embed", "base", "img", "input"})
+# Containers that hold a post body: Substack's "available-content" wrapper and its "body markup" div
+MAIN_CONTENT_CLASSES = ("available-content",)
+MAIN_CONTENT_CLASS_SETS = (frozenset({"body", "markup"}),)
+# Text-density fallback: a line scores len(text) - LINK_TEXT_WEIGHT * len(link text) - LINE_PENALTY, and the
+# best-scoring run of consecutive lines is the body (short and link-heavy nav/footer lines score negative)
+LINK_TEXT_WEIGHT = 2
+LINE_PENALTY = 40
+# <meta> names/properties kept for page_info()
+PAGE_META_KEYS = frozenset(
+    {"author", "description", "og:title", "og:description", "article:published_time", "article:author"}
+)
+MAX_CAPTURE_CHARS = 64 * 1024  # per captured element (<title>, JSON-LD script, tagline)
 
 
 class _HTMLStripper(HTMLParser):
-    """Strip script, style, meta, and other non-content tags; output plain text."""
+    """Strip script, style, meta, and other non-content tags; output plain text.
+
+    Whitespace is collapsed as data arrives, so only finished (stripped, non-empty) lines and the current
+    partial line are kept. Once max_chars is reached, </body> closes or (with main_content) the post
+    body container closes, the stripper sets done and ignores the rest of the document, so a caller
+    feeding chunks can stop reading. A closing </article> is not an end: teaser and "related" cards
+    are often <article>s that come before the post itself.
+
+    With main_content, only the post body is kept: the text of the first MAIN_CONTENT_CLASSES container if
+    the page has one, otherwise the densest run of lines (see LINE_PENALTY).
+    """
 
-    def __init__(self):
+    def __init__(self, max_chars: int | None = None, main_content: bool = False):
         super().__init__()
+        self.max_chars = max_chars
+        self.main_content = main_content
+        self.done = False
         self._skip_depth = 0
-        self._result = []
+        self._container_tag = None  # tag of the main-content container we are inside
+        self._container_depth = 0
+        self._found_container = False
+        self._link_depth = 0
+        self._line_link_chars = 0
+        self._link_chars = []  # link characters per entry of _lines (main_content only)
+        self._capture_tag = None  # element whose text is being captured for page_info()
+        self._capture_name = None
+        self._captured = []
+        self._page = {"meta": {}, "ld_json": []}
+        self._lines = []
+        self._line = ""
+        self._chars = 0  # characters in _lines, counting the joining newlines
+        self._last = None  # last fragment appended, for the block-tag newline rule
         self._block_tags = frozenset(
             {"p", "div", "li", "tr", "td", "th", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr"}
         )
 
     def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
         tag = tag.lower()
+        self._capture_start(tag, attrs)
+        if self.main_content and self._skip_depth == 0:
+            if self._container_tag == tag:
+                self._container_depth += 1
+            elif not self._found_container and _is_main_content(attrs):
+                self._enter_container(tag)
+                return
+            if tag == "a":
+                self._link_depth += 1
         if tag in STRIP_WITH_CONTENT:
             self._skip_depth += 1
-        elif tag in self._block_tags and self._skip_depth == 0 and self._result and self._result[-1] not in (" ", "\n"):
-            self._result.append("\n")
+        elif tag in self._block_tags and self._skip_depth == 0 and self._last is not None and self._last not in (" ", "\n"):
+            self._append("\n")
 
     def handle_endtag(self, tag):
+        if self.done:
+            return
         tag = tag.lower()
+        if tag == self._capture_tag:
+            self._capture_end()
+        if self._container_tag == tag and self._skip_depth == 0:
+            self._container_depth -= 1
+            if self._container_depth == 0:
+                self._finish()
+                return
+        if tag == "a" and self._link_depth:
+            self._link_depth -= 1
         if tag in STRIP_WITH_CONTENT:
             self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "body":
+            self._finish()
         elif tag in self._block_tags and self._skip_depth == 0:
-            self._result.append("\n")
+            self._append("\n")
 
     def handle_data(self, data):
-        if self._skip_depth == 0:
-            self._result.append(data)
+        if self._capture_tag is not None and sum(map(len, self._captured)) < MAX_CAPTURE_CHARS:
+            self._captured.append(data)
+        if self._skip_depth == 0 and not self.done:
+            if self._link_depth:
+                self._line_link_chars += len(data.strip())
+            self._append(data)
+
+    def _capture_start(self, tag: str, attrs) -> None:
+        attributes = {name.lower(): value or "" for name, value in attrs}
+        if tag == "meta":
+            key = (attributes.get("property") or attributes.get("name") or "").lower()
+            if key in PAGE_META_KEYS and key not in self._page["meta"]:
+                self._page["meta"][key] = attributes.get("content") or ""
+            return
+        if tag == "time" and attributes.get("datetime"):
+            self._page.setdefault("time", attributes["datetime"])
+            return
+        if self._capture_tag is not None:
+            return
+        name = None
+        if tag == "title" and "title" not in self._page:
+            name = "title"
+        elif tag == "script" and attributes.get("type", "").lower() == "application/ld+json":
+            name = "ld_json"
+        elif tag == "p" and "tagline" not in self._page:
+            classes = attributes.get("class", "").split()
+            if "publication-tagline" in classes and "with-cover" in classes:
+                name = "tagline"
+        if name is not None:
+            self._capture_tag, self._capture_name, self._captured = tag, name, []
+
+    def _capture_end(self) -> None:
+        text = "".join(self._captured)
+        if self._capture_name == "ld_json":
+            self._page["ld_json"].append(text)
+        else:
+            self._page[self._capture_name] = text
+        self._capture_tag = self._capture_name = None
+        self._captured = []
+
+    def page_info(self) -> dict:
+        """Return what the page says about itself: { raw_title, tagline, author, description, published }
+        from <title>, the Substack publication tagline, <meta> tags, JSON-LD and the first <time datetime>."""
+        meta = self._page["meta"]
+        author = meta.get("author") or meta.get("article:author")
+        published = meta.get("article:published_time")
+        for raw in self._page["ld_json"]:
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                continue
+            for item in data if isinstance(data, list) else [data]:
+                if not isinstance(item, dict):
+                    continue
+                published = published or item.get("datePublished")
+                if not author:
+                    authors = item.get("author")
+                    first = authors[0] if isinstance(authors, list) and authors else authors
+                    author = first.get("name") if isinstance(first, dict) else first if isinstance(first, str) else None
+        tagline = self._page.get("tagline")
+        return {
+            "raw_title": " ".join(self._page.get("title", "").split()) or meta.get("og:title") or "",
+            "tagline": " ".join(tagline.split()) if tagline else None,
+            "author": author or None,
+            "description": meta.get("og:description") or meta.get("description") or None,
+            "published": published or self._page.get("time") or None,
+        }
+
+    def _enter_container(self, tag: str) -> None:
+        # drop everything before the post body (nav, header, subscribe prompts)
+        self._found_container = True
+        self._container_tag = tag
+        self._container_depth = 1
+        self._lines = []
+        self._link_chars = []
+        self._line = ""
+        self._chars = 0
+        self._last = None
+        self._link_depth = 0
+        self._line_link_chars = 0
+
+    def _append(self, fragment: str) -> None:
+        self._last = fragment
+        pieces = (self._line + fragment).splitlines(keepends=True)
+        self._line = ""
+        if pieces and pieces[-1].splitlines() == [pieces[-1]]:  # no line break yet
+            self._line = pieces.pop()
+        for piece in pieces:
+            self._add_line(piece)
+            if self.done:
+                return
+        if self.max_chars is not None and self._chars + len(self._line.strip()) > self.max_chars:
+            self._finish()
+
+    def _add_line(self, line: str) -> None:
+        line = line.strip()
+        if not line:
+            return
+        if self._lines:
+            self._chars += 1
+        if self.max_chars is not None and self._chars + len(line) >= self.max_chars:
+            line = line[:max(0, self.max_chars - self._chars)]
+            self.done = True
+            self._line = ""
+        if line:
+            self._lines.append(line)
+            self._chars += len(line)
+            if self.main_content:
+                self._link_chars.append(min(self._line_link_chars, len(line)))
+                self._line_link_chars = 0
+
+    def _finish(self) -> None:
+        line, self._line = self._line, ""
+        self._add_line(line)
+        self.done = True
 
     def get_text(self):
-        text = "".join(self._result)
-        # collapse runs of whitespace and strip
-        return "\n".join(line.strip() for line in text.splitlines() if line.strip()).strip()
+        lines = list(self._lines)
+        if self._line.strip():
+            lines.append(self._line.strip())
+        if self.main_content and not self._found_container:
+            link_chars = self._link_chars + [self._line_link_chars] * (len(lines) - len(self._link_chars))
+            lines = _densest_run(lines, link_chars)
+        return "\n".join(lines).strip()
+
+
+def _is_main_content(attrs) -> bool:
+    classes = set()
+    for name, value in attrs:
+        if name == "class" and value:
+            classes.update(value.split())
+    return any(c in classes for c in MAIN_CONTENT_CLASSES) or any(s <= classes for s in MAIN_CONTENT_CLASS_SETS)
+
 
+def _densest_run(lines: list[str], link_chars: list[int]) -> list[str]:
+    """Return the consecutive run of lines with the highest total text-density score (max-subarray)."""
+    best_score, best_start, best_end = 0, 0, 0
+    score, start = 0, 0
+    for i, (line, links) in enumerate(zip(lines, link_chars)):
+        if score <= 0:
+            score, start = 0, i
+        score += len(line) - LINK_TEXT_WEIGHT * links - LINE_PENALTY
+        if score > best_score:
+            best_score, best_start, best_end = score, start, i + 1
+    return lines[best_start:best_end] if best_score > 0 else lines
 
-def _strip_html(html: str) -> str:
-    """Remove script, style, meta, and other junk; return plain text."""
-    stripper = _HTMLStripper()
+
+def _strip_html(html: str, main_content: bool = False) -> str:
+    """Remove script, style, meta, and other junk; return plain text (only the post body with main_content)."""
+    stripper = _HTMLStripper(main_content=main_content)
     stripper.feed(html)
     return stripper.get_text()
+
+
+def extract_page(chunks: Iterable[str], max_chars: int | None = None, main_content: bool = False) -> tuple[str, dict]:
+    """Like _strip_html for HTML arriving in pieces, also returning the page's page_info() from the same parse.
+
+    Stops consuming chunks once max_chars or the end of the body is reached.
+    """
+    stripper = _HTMLStripper(max_chars, main_content)
+    for chunk in chunks:
+        stripper.feed(chunk)
+        if stripper.done:
+            break
+    else:
+        stripper.close()
+    return stripper.get_text(), stripper.page_info()
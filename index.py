@@ -1,35 +1,55 @@
 import os
-import hashlib
+import asyncio
+import base64
+import inspect
+import json
+import threading
+from datetime import date
+from functools import wraps
 from urllib.parse import urlparse, unquote
 
-import jwt
-from jwt import PyJWKClient
 from dotenv import load_dotenv
-from flask import Flask, render_template_string, request, jsonify
-from substack_api import Newsletter
+from flask import Flask, Response, render_template_string, request, jsonify
 from supabase import create_client
 
+from auth import verify_token
 from build_list import build_list
+from read_state import ReadStateCache
+from relevance import score_texts
 from substack import get_posts, get_posts_list, get_recommendations
-from get_title import get_title
-from context import get_article, summarize_article
+from get_title import get_title, get_titles
+from llm import get_usage, llm_route
+from context import fetch_article, get_cached_article, summarize_article
+from summarize_article import get_cached_summary, summarize_article_stream, summary_id_for_url
 
 load_dotenv()
 
 app = Flask(__name__)
+# Serve with a threaded WSGI server, e.g. `gunicorn -k gthread --workers 2 --threads 32 index:app`. Flask runs
+# each async view to completion on the request's thread, so the views only overlap their own outbound calls
+# (asyncio.gather / to_thread). The per-route limits below are per process and count requests in flight on
+# that process's threads: they need gthread (or another threaded worker) to ever fill up. With gunicorn sync
+# workers there is one request per process and the 503 + Retry-After backpressure never triggers.
+NEWSLETTERS_TITLE_DEADLINE_SECONDS = 3.0
+# Max requests per route handled at once; further requests get 503 + Retry-After instead of queueing
+# behind slow ones, so a burst of /posts/summary calls can't starve /newsletters or /posts/read.
+ROUTE_CONCURRENCY_LIMITS = {
+    "subscribe_by_url": 8,
+    "get_newsletters": 32,
+    "get_posts_route": 32,
+    "get_feed": 16,
+    "get_post_summary": 4,
+    "get_post_summary_stream": 4,
+    "set_post_read_state": 32,
+    "api_get_title": 8,
+    "api_llm_usage": 4,
+}
+RETRY_AFTER_SECONDS = 5
+POSTS_PAGE_SIZE = 20
+MAX_POSTS_PAGE_SIZE = 100
+READ_STATE_QUERY_BATCH = 100  # post URLs per `in` filter, keeps the PostgREST query string short
+_READ_STATE = ReadStateCache()
 _supabase_client = None
-_jwks_client = None
-
-
-def _get_jwks_client() -> PyJWKClient:
-    """Return cached JWKS client for Supabase Auth (ES256 public keys)."""
-    global _jwks_client
-    if _jwks_client is None:
-        url = os.environ.get("SUPABASE_URL", "").rstrip("/")
-        if not url:
-            raise RuntimeError("SUPABASE_URL must be set")
-        _jwks_client = PyJWKClient(f"{url}/auth/v1/.well-known/jwks.json")
-    return _jwks_client
 
 
 def _get_supabase():
@@ -45,26 +65,59 @@ def _get_supabase():
 
 
 def _get_user_id_from_request() -> str | None:
-    """Extract and verify Bearer JWT (ES256 via JWKS); return sub (user_id) or None."""
+    """Extract and verify Bearer JWT (ES256 via cached JWKS, see auth.py); return sub (user_id) or None."""
     auth = request.headers.get("Authorization")
     if not auth or not auth.startswith("Bearer "):
         return None
     token = auth[7:].strip()
     if not token:
         return None
-    try:
-        jwks = _get_jwks_client()
-        signing_key = jwks.get_signing_key_from_jwt(token)
-        payload = jwt.decode(
-            token,
-            signing_key.key,
-            algorithms=["ES256"],
-            audience="authenticated",
-            options={"verify_aud": True},
-        )
-        return payload.get("sub")
-    except Exception:
-        return None
+    payload = verify_token(token)
+    return payload.get("sub") if payload else None
+
+
+def _concurrency_limited(view):
+    """Reject requests beyond ROUTE_CONCURRENCY_LIMITS[view name] with 503 and a Retry-After header.
+
+    LLM calls made while handling the request are accounted to the view name (see llm.get_usage()).
+    """
+    semaphore = threading.BoundedSemaphore(ROUTE_CONCURRENCY_LIMITS[view.__name__])
+
+    def saturated():
+        response = jsonify({"error": "Server busy, please retry"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(RETRY_AFTER_SECONDS)
+        return response
+
+    if inspect.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            if not semaphore.acquire(blocking=False):
+                return saturated()
+            try:
+                with llm_route(view.__name__):
+                    return await view(*args, **kwargs)
+            finally:
+                semaphore.release()
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not semaphore.acquire(blocking=False):
+            return saturated()
+        try:
+            with llm_route(view.__name__):
+                response = view(*args, **kwargs)
+        except BaseException:
+            semaphore.release()
+            raise
+        if isinstance(response, Response) and response.is_streamed:
+            # hold the slot until the streamed body has been sent
+            response.call_on_close(semaphore.release)
+        else:
+            semaphore.release()
+        return response
+    return wrapper
 
 
 # app.config["JSON_AS_ASCII"] = False  # output Unicode (e.g. ®) instead of \u00ae
@@ -118,7 +171,8 @@ def _normalize_post_url(url: str) -> str | None:
 
 
 @app.route("/newsletters/subscribe-by-url", methods=["POST", "OPTIONS"])
-def subscribe_by_url():
+@_concurrency_limited
+async def subscribe_by_url():
     if request.method == "OPTIONS":
         return "", 204
     data = request.get_json(silent=True) or {}
@@ -129,12 +183,11 @@ def subscribe_by_url():
     if normalized is None:
         return jsonify({"success": False, "message": "Invalid URL"}), 400
     try:
-        newsletter = Newsletter(normalized)
-        newsletter.get_posts(limit=1)
+        await asyncio.to_thread(get_posts_list, normalized, 1)
     except Exception:
         return jsonify({"success": False, "message": "Not a valid Substack newsletter"}), 400
     try:
-        info = get_title(normalized)
+        info = await asyncio.to_thread(get_title, normalized)
         title = info.get("title") or ""
         subtitle = info.get("subtitle")
     except Exception:
@@ -148,12 +201,12 @@ def subscribe_by_url():
     except RuntimeError:
         return jsonify({"success": False, "message": "Failed to save subscription. Please try again."}), 500
     try:
-        existing = (
+        existing = await asyncio.to_thread(
             supabase.table("newsletter_urls")
             .select("id")
             .eq("user_id", user_id)
             .eq("url", normalized)
-            .execute()
+            .execute
         )
     except Exception:
         return jsonify({"success": False, "message": "Failed to save subscription. Please try again."}), 500
@@ -161,7 +214,7 @@ def subscribe_by_url():
         message = "You're already subscribed to this newsletter."
     else:
         try:
-            supabase.table("newsletter_urls").insert({"user_id": user_id, "url": normalized}).execute()
+            await asyncio.to_thread(supabase.table("newsletter_urls").insert({"user_id": user_id, "url": normalized}).execute)
         except Exception:
             return jsonify({"success": False, "message": "Failed to save subscription. Please try again."}), 500
         message = f"Added: {title}" if title else "Added."
@@ -172,8 +225,13 @@ def subscribe_by_url():
 
 
 @app.route("/newsletters", methods=["GET"])
-def get_newsletters():
-    """Return the authenticated user's newsletters: { newsletters: [ { title, author, url [, id] } ] }."""
+@_concurrency_limited
+async def get_newsletters():
+    """Return the authenticated user's newsletters: { newsletters: [ { title, author, url [, id, pending] } ] }.
+
+    Titles are fetched concurrently; rows whose title is not resolved within NEWSLETTERS_TITLE_DEADLINE_SECONDS
+    come back with empty title/author and pending: true, and are filled in the background for the next request.
+    """
     user_id = _get_user_id_from_request()
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
@@ -182,33 +240,155 @@ def get_newsletters():
     except RuntimeError:
         return jsonify({"error": "Service unavailable"}), 500
     try:
-        rows = (
+        rows = await asyncio.to_thread(
             supabase.table("newsletter_urls")
             .select("id, url")
             .eq("user_id", user_id)
-            .execute()
+            .execute
         )
     except Exception:
         return jsonify({"error": "Failed to load newsletters"}), 500
+    rows = rows.data or []
+    titles = await asyncio.to_thread(
+        get_titles, [row["url"] for row in rows if row.get("url")], deadline=NEWSLETTERS_TITLE_DEADLINE_SECONDS
+    )
     newsletters = []
-    for row in (rows.data or []):
+    for row in rows:
         url = row.get("url") or ""
         item = {"url": url, "title": "", "author": ""}
         if row.get("id") is not None:
             item["id"] = row["id"]
-        try:
-            info = get_title(url)
+        if url and url not in titles:
+            item["pending"] = True
+        elif titles.get(url):
+            info = titles[url]
             item["title"] = info.get("title") or ""
             item["author"] = info.get("author") or ""
-        except Exception:
-            pass
         newsletters.append(item)
     return jsonify({"newsletters": newsletters})
 
 
+def _query_read_post_urls(user_id: str, urls: list[str]) -> set[str]:
+    """Return which of urls are in the user's read_posts rows, querying only those URLs."""
+    supabase = _get_supabase()
+    read_post_urls = set()
+    for start in range(0, len(urls), READ_STATE_QUERY_BATCH):
+        rows = (
+            supabase.table("read_posts")
+            .select("post_url")
+            .eq("user_id", user_id)
+            .in_("post_url", urls[start:start + READ_STATE_QUERY_BATCH])
+            .execute()
+        )
+        for row in (rows.data or []):
+            url = row.get("post_url")
+            if url:
+                read_post_urls.add(url)
+    return read_post_urls
+
+
+def _get_read_post_urls(user_id: str, urls: list[str]) -> set[str]:
+    """Return which of urls the user has marked read, via the per-user cache (empty on any error)."""
+    try:
+        return _READ_STATE.get_read_urls(user_id, urls, _query_read_post_urls)
+    except Exception:
+        return set()
+
+
+def _post_item(p: dict, read_post_urls: set[str]) -> dict:
+    post_id = p.get("id")
+    raw_url = p.get("url") or ""
+    norm_url = _normalize_post_url(raw_url) or raw_url
+    item = {
+        "title": p.get("title") or "",
+        "date": p.get("post_date") or "",
+        "read": norm_url in read_post_urls if norm_url else False,
+    }
+    if post_id is not None:
+        item["id"] = post_id
+    if raw_url:
+        item["url"] = raw_url
+    return item
+
+
+def _page_key(item: dict) -> tuple[str, str]:
+    return (item.get("date") or "", str(item.get("id", "")))
+
+
+def _relevance_page_key(item: dict) -> tuple[float, str, str]:
+    return (item.get("relevance") or 0.0, *_page_key(item))
+
+
+def _encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def _decode_cursor(cursor: str | None, sort: str = "date") -> tuple | None:
+    """Raises ValueError for a malformed cursor (or one from the other sort order)."""
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort == "relevance":
+            score, date, post_id = key
+            return (float(score), str(date), str(post_id))
+        date, post_id = key
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return (str(date), str(post_id))
+
+
+def _parse_page_args() -> tuple[bool, str, tuple | None, int, str]:
+    """Return (unread_only, since, cursor, limit, sort) from the query string. Raises ValueError if invalid."""
+    unread_only = (request.args.get("unread_only") or "").lower() in ("1", "true", "yes")
+    since = (request.args.get("since") or "").strip()
+    if since:
+        try:
+            since = date.fromisoformat(since).isoformat()  # compared as a string against post_date
+        except ValueError:
+            raise ValueError("Invalid since")
+    sort = (request.args.get("sort") or "date").lower()
+    if sort not in ("date", "relevance"):
+        raise ValueError("Invalid sort")
+    cursor = _decode_cursor(request.args.get("cursor"), sort)
+    try:
+        limit = int(request.args.get("limit") or POSTS_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("Invalid limit")
+    if limit < 1:
+        raise ValueError("Invalid limit")
+    return unread_only, since, cursor, min(limit, MAX_POSTS_PAGE_SIZE), sort
+
+
+async def _add_relevance(pairs: list[tuple[dict, dict]]) -> None:
+    """Set item["relevance"] for (item, raw post) pairs from the post's title and subtitle (local scoring, no network)."""
+    texts = [f"{p.get('title') or ''}\n{p.get('subtitle') or ''}" for _, p in pairs]
+    scores = await asyncio.to_thread(score_texts, texts)
+    for (item, _), score in zip(pairs, scores):
+        item["relevance"] = round(score, 4)
+
+
+def _paginate(items: list[dict], cursor: tuple | None, limit: int, sort: str = "date") -> tuple[list[dict], str | None]:
+    """Return (page, next_cursor) over items ordered newest first by (date, id), or most relevant first by
+    (relevance, date, id) for sort="relevance"; cursor is the last key served."""
+    page_key = _relevance_page_key if sort == "relevance" else _page_key
+    items = sorted(items, key=page_key, reverse=True)
+    if cursor is not None:
+        items = [item for item in items if page_key(item) < cursor]
+    page = items[:limit]
+    next_cursor = _encode_cursor(page_key(page[-1])) if len(items) > limit else None
+    return page, next_cursor
+
+
 @app.route("/posts", methods=["GET"])
-def get_posts_route():
-    """Return posts for a newsletter: { posts: [ { title, date, read [, id, url] } ] }. Requires Bearer auth."""
+@_concurrency_limited
+async def get_posts_route():
+    """Return posts for a newsletter: { posts: [ { title, date, read [, id, url] } ] [, next_cursor] }. Requires Bearer auth.
+
+    Optional query params: unread_only (1/true), since (yyyy-mm-dd, inclusive), limit (page size, default 20),
+    cursor (the next_cursor of the previous page) and sort ("date", the default, or "relevance": most
+    relevant to the me/ context first, with a "relevance" score on each post).
+    """
     user_id = _get_user_id_from_request()
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
@@ -219,49 +399,101 @@ def get_posts_route():
     normalized = _normalize_newsletter_url(newsletter_url)
     if normalized is None:
         return jsonify({"error": "Invalid newsletter URL"}), 400
-    read_post_urls = set()
+    try:
+        unread_only, since, cursor, limit, sort = _parse_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        raw_posts = await asyncio.to_thread(get_posts_list, normalized)
+    except Exception:
+        return jsonify({"error": "Failed to fetch posts"}), 500
+    if since:
+        raw_posts = [p for p in raw_posts if (p.get("post_date") or "") >= since]
+    post_urls = [_normalize_post_url(p["url"]) or p["url"] for p in raw_posts if p.get("url")]
+    read_post_urls = await asyncio.to_thread(_get_read_post_urls, user_id, post_urls)
+    posts = [_post_item(p, read_post_urls) for p in raw_posts]
+    if sort == "relevance":
+        await _add_relevance(list(zip(posts, raw_posts)))
+    if unread_only:
+        posts = [item for item in posts if not item["read"]]
+    page, next_cursor = _paginate(posts, cursor, limit, sort)
+    payload = {"posts": page}
+    if next_cursor:
+        payload["next_cursor"] = next_cursor
+    return jsonify(payload)
+
+
+@app.route("/feed", methods=["GET"])
+@_concurrency_limited
+async def get_feed():
+    """Return posts from all of the user's newsletters, newest first, in one call.
+
+    Response: { posts: [ { title, date, read, newsletter_url [, id, url] } ] [, next_cursor] }. Accepts the
+    same unread_only / since / limit / cursor / sort params as /posts. Post lists are fetched concurrently and read
+    state comes from a single lookup over all listed posts. Requires Bearer auth.
+    """
+    user_id = _get_user_id_from_request()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        unread_only, since, cursor, limit, sort = _parse_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     try:
         supabase = _get_supabase()
-        rows = (
-            supabase.table("read_posts")
-            .select("post_url")
+    except RuntimeError:
+        return jsonify({"error": "Service unavailable"}), 500
+    try:
+        rows = await asyncio.to_thread(
+            supabase.table("newsletter_urls")
+            .select("url")
             .eq("user_id", user_id)
-            .execute()
+            .execute
         )
-        for row in (rows.data or []):
-            url = row.get("post_url")
-            if url:
-                read_post_urls.add(url)
     except Exception:
-        pass
-    try:
-        raw_posts = get_posts_list(normalized)
-    except Exception:
-        return jsonify({"error": "Failed to fetch posts"}), 500
-    posts = []
-    for p in raw_posts:
-        post_id = p.get("id")
-        raw_url = p.get("url") or ""
-        norm_url = _normalize_post_url(raw_url) or raw_url
-        item = {
-            "title": p.get("title") or "",
-            "date": p.get("post_date") or "",
-            "read": norm_url in read_post_urls if norm_url else False,
-        }
-        if post_id is not None:
-            item["id"] = post_id
-        if raw_url:
-            item["url"] = raw_url
-        posts.append(item)
-    return jsonify({"posts": posts})
+        return jsonify({"error": "Failed to load newsletters"}), 500
+    newsletter_urls = list(dict.fromkeys(
+        normalized for normalized in (_normalize_newsletter_url(row.get("url") or "") for row in (rows.data or [])) if normalized
+    ))
+    post_lists = await asyncio.gather(
+        *(asyncio.to_thread(get_posts_list, url) for url in newsletter_urls),
+        return_exceptions=True,
+    )
+    raw_posts = []
+    for newsletter_url, post_list in zip(newsletter_urls, post_lists):
+        if isinstance(post_list, Exception):
+            continue
+        for p in post_list:
+            if not since or (p.get("post_date") or "") >= since:
+                raw_posts.append((newsletter_url, p))
+    post_urls = [_normalize_post_url(p["url"]) or p["url"] for _, p in raw_posts if p.get("url")]
+    read_post_urls = await asyncio.to_thread(_get_read_post_urls, user_id, post_urls)
+    pairs = []
+    for newsletter_url, p in raw_posts:
+        item = _post_item(p, read_post_urls)
+        if unread_only and item["read"]:
+            continue
+        item["newsletter_url"] = newsletter_url
+        pairs.append((item, p))
+    if sort == "relevance":
+        await _add_relevance(pairs)
+    posts = [item for item, _ in pairs]
+    page, next_cursor = _paginate(posts, cursor, limit, sort)
+    payload = {"posts": page}
+    if next_cursor:
+        payload["next_cursor"] = next_cursor
+    return jsonify(payload)
 
 
 @app.route("/posts/summary", methods=["POST"])
-def get_post_summary():
+@_concurrency_limited
+async def get_post_summary():
     """Return summary for a single post URL.
 
     Requires query param post_url and Bearer auth.
-    Response: { id, url, article_title, post_date, short_summary, full_summary }
+    Response: { id, url, article_title, author, subtitle, post_date, short_summary, full_summary }
+    The article text and its metadata come from one download of post_url, which also fills the title cache.
+    A post that is already summarized is answered from the summary and article caches with no outbound request.
     """
     user_id = _get_user_id_from_request()
     if not user_id:
@@ -273,15 +505,48 @@ def get_post_summary():
     post_url = unquote(raw_url)
     if not post_url.startswith(("http://", "https://")):
         post_url = "https://" + post_url
-    try:
-        article_text = get_article(post_url)
-    except Exception:
-        return jsonify({"error": "Failed to fetch article"}), 500
-    cache_id = hashlib.sha1(post_url.encode("utf-8")).hexdigest()[:16]
-    try:
-        summary = summarize_article(cache_id, article_text)
-    except Exception:
-        return jsonify({"error": "Failed to summarize article"}), 500
+    cache_id = summary_id_for_url(post_url)
+    summary, article = await asyncio.to_thread(_cached_summary_and_article, cache_id, post_url)
+    if summary is None:
+        try:
+            article = await asyncio.to_thread(fetch_article, post_url)
+        except Exception:
+            return jsonify({"error": "Failed to fetch article"}), 500
+        try:
+            summary = await asyncio.to_thread(summarize_article, cache_id, article["text"])
+        except Exception:
+            return jsonify({"error": "Failed to summarize article"}), 500
+    short_summary, full_summary = _summary_parts(summary)
+    return jsonify(
+        {
+            "id": cache_id,
+            "url": post_url,
+            **_article_metadata(article),
+            "short_summary": short_summary,
+            "full_summary": full_summary,
+        }
+    )
+
+
+def _cached_summary_and_article(cache_id: str, post_url: str) -> tuple:
+    """Return (cached summary or None, cached article metadata or {}) without any network I/O."""
+    summary = get_cached_summary(cache_id)
+    if summary is None:
+        return None, {}
+    return summary, get_cached_article(post_url) or {}
+
+
+def _article_metadata(article: dict) -> dict:
+    return {
+        "article_title": article.get("title") or "",
+        "author": article.get("author"),
+        "subtitle": article.get("subtitle"),
+        "post_date": article.get("post_date") or "",
+    }
+
+
+def _summary_parts(summary) -> tuple[str, str]:
+    """Return (short_summary, full_summary) from a cached summary in any of its historical shapes."""
     if isinstance(summary, dict):
         short_summary = (
             summary.get("short_summary")
@@ -295,29 +560,72 @@ def get_post_summary():
             or summary.get("fullSummary")
             or ""
         )
-    else:
-        short_summary = ""
-        full_summary = str(summary)
-    try:
-        title_info = get_title(post_url)
-        article_title = title_info.get("title") or ""
-    except Exception:
-        article_title = ""
-    post_date = ""
-    return jsonify(
-        {
-            "id": cache_id,
-            "url": post_url,
-            "article_title": article_title,
-            "post_date": post_date,
-            "short_summary": short_summary,
-            "full_summary": full_summary,
-        }
-    )
+        return short_summary, full_summary
+    return "", str(summary)
+
+
+@app.route("/posts/summary/stream", methods=["POST"])
+@_concurrency_limited
+def get_post_summary_stream():
+    """Streaming variant of /posts/summary as NDJSON (one JSON object per line).
+
+    Events, in order: { event: "metadata", id, url, article_title, author, subtitle, post_date }, { event: "short_summary",
+    short_summary }, { event: "full_summary_delta", delta } (repeated), { event: "done", short_summary,
+    full_summary }. On failure an { event: "error", error } line ends the stream. An already summarized post
+    is answered from the caches without fetching the article, the full summary as a single delta.
+    """
+    user_id = _get_user_id_from_request()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+    body = request.get_json(silent=True) or {}
+    raw_url = (request.args.get("post_url") or body.get("post_url") or "").strip()
+    if not raw_url:
+        return jsonify({"error": "post_url is required"}), 400
+    post_url = unquote(raw_url)
+    if not post_url.startswith(("http://", "https://")):
+        post_url = "https://" + post_url
+    cache_id = summary_id_for_url(post_url)
+
+    def generate():
+        summary, article = _cached_summary_and_article(cache_id, post_url)
+        if summary is not None:
+            # already summarized: answer from the caches without fetching the article
+            short_summary, full_summary = _summary_parts(summary)
+            yield _ndjson({"event": "metadata", "id": cache_id, "url": post_url, **_article_metadata(article)})
+            yield _ndjson({"event": "short_summary", "short_summary": short_summary})
+            yield _ndjson({"event": "full_summary_delta", "delta": full_summary})
+            yield _ndjson({"event": "done", "short_summary": short_summary, "full_summary": full_summary})
+            return
+        try:
+            article = fetch_article(post_url)
+        except Exception:
+            yield _ndjson({"event": "error", "error": "Failed to fetch article"})
+            return
+        article_text = article["text"]
+        yield _ndjson({"event": "metadata", "id": cache_id, "url": post_url, **_article_metadata(article)})
+        try:
+            # the body is generated after the view has returned, so set the route for LLM accounting here
+            with llm_route("get_post_summary_stream"):
+                for event, data in summarize_article_stream(cache_id, article_text):
+                    if event == "short_summary":
+                        yield _ndjson({"event": event, "short_summary": data})
+                    elif event == "full_summary_delta":
+                        yield _ndjson({"event": event, "delta": data})
+                    else:
+                        yield _ndjson({"event": event, **data})
+        except Exception:
+            yield _ndjson({"event": "error", "error": "Failed to summarize article"})
+
+    return Response(generate(), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+def _ndjson(obj: dict) -> str:
+    return json.dumps(obj) + "\n"
 
 
 @app.route("/posts/read", methods=["POST"])
-def set_post_read_state():
+@_concurrency_limited
+async def set_post_read_state():
     """Mark a post as read or unread for the authenticated user.
 
     Body: { "post_url": "<article URL>", "read": true | false }
@@ -344,16 +652,18 @@ def set_post_read_state():
     try:
         table = supabase.table("read_posts")
         if desired_read:
-            table.upsert({"user_id": user_id, "post_url": norm_url}).execute()
+            await asyncio.to_thread(table.upsert({"user_id": user_id, "post_url": norm_url}).execute)
         else:
-            table.delete().eq("user_id", user_id).eq("post_url", norm_url).execute()
+            await asyncio.to_thread(table.delete().eq("user_id", user_id).eq("post_url", norm_url).execute)
     except Exception:
         return jsonify({"error": "Failed to update read state"}), 500
+    _READ_STATE.set(user_id, norm_url, desired_read)
     return jsonify({"ok": True})
 
 
 @app.route("/api/get_title/", methods=["POST"])
-def api_get_title():
+@_concurrency_limited
+async def api_get_title():
     url = request.form.get("url")
     if not url or not url.strip():
         return jsonify({"error": "url is required"}), 400
@@ -361,11 +671,20 @@ def api_get_title():
     if not url.startswith(("http://", "https://")):
         return jsonify({"error": "url must be http or https"}), 400
     try:
-        result = get_title(url)
+        result = await asyncio.to_thread(get_title, url)
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": "Failed to fetch or parse URL", "detail": str(e)}), 500
 
 
+@app.route("/api/llm_usage", methods=["GET"])
+@_concurrency_limited
+def api_llm_usage():
+    """LLM calls, retries, errors, tokens and estimated cost per route since this worker started."""
+    if not _get_user_id_from_request():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(get_usage())
+
+
 if __name__ == "__main__":
     app.run(debug=True,port=5001)
\ No newline at end of file
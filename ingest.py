@@ -0,0 +1,176 @@
+"""Background ingestion worker: pre-summarizes new posts for every subscribed newsletter.
+
+Reads the distinct newsletter URLs from the Supabase newsletter_urls table, finds posts newer than each
+newsletter's watermark, fetches and strips them and summarizes them into the same cache /posts/summary
+reads, so the first click on a post no longer pays for the fetch and the LLM call.
+
+Progress (watermarks, completed posts, today's token spend) is saved to ingest_state.json after every
+post, so a restarted worker resumes where it stopped.
+
+Usage: python ingest.py [--once]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+from context import get_article
+from llm import llm_route
+from substack import get_posts_list
+from summarize_article import (
+    estimate_tokens,
+    get_cached_summary,
+    get_cached_summary_for_text,
+    summarize_article,
+    summary_id_for_url,
+)
+
+load_dotenv()
+
+STATE_PATH = Path(__file__).parent / "ingest_state.json"
+INGEST_INTERVAL_SECONDS = int(os.environ.get("INGEST_INTERVAL_SECONDS", 30 * 60))
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", 4))
+INGEST_DAILY_TOKEN_BUDGET = int(os.environ.get("INGEST_DAILY_TOKEN_BUDGET", 500_000))
+LOOKBACK_DAYS = 7  # how far back to go for a newsletter seen for the first time
+POSTS_PER_NEWSLETTER = 20
+SUMMARY_OUTPUT_TOKENS = 400  # rough allowance for the completion when estimating a call's cost
+
+_STATE_LOCK = threading.Lock()
+
+
+def _load_state() -> dict:
+    if STATE_PATH.exists():
+        return json.loads(STATE_PATH.read_text())
+    return {"newsletters": {}, "budget": {"date": "", "tokens": 0}}
+
+
+def _save_state(state: dict) -> None:
+    tmp_path = STATE_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state, indent=2))
+    tmp_path.replace(STATE_PATH)
+
+
+def _get_newsletter_urls() -> list[str]:
+    """Return the distinct newsletter URLs any user is subscribed to."""
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+    rows = create_client(url, key).table("newsletter_urls").select("url").execute()
+    return sorted({row["url"] for row in (rows.data or []) if row.get("url")})
+
+
+def _estimate_tokens(article_text: str) -> int:
+    return estimate_tokens(article_text) + SUMMARY_OUTPUT_TOKENS
+
+
+def _reserve_tokens(state: dict, tokens: int) -> bool:
+    """Charge tokens against today's budget; False if that would exceed INGEST_DAILY_TOKEN_BUDGET."""
+    with _STATE_LOCK:
+        budget = state["budget"]
+        today = date.today().isoformat()
+        if budget["date"] != today:
+            budget["date"] = today
+            budget["tokens"] = 0
+        if budget["tokens"] + tokens > INGEST_DAILY_TOKEN_BUDGET:
+            return False
+        budget["tokens"] += tokens
+        return True
+
+
+def _new_posts(newsletter_state: dict, posts: list[dict]) -> list[dict]:
+    """Posts dated on/after the watermark that are not already done, oldest first."""
+    done = set(newsletter_state["done"])
+    watermark = newsletter_state["watermark"]
+    new = [p for p in posts if p.get("url") and p.get("post_date", "") >= watermark and p["url"] not in done]
+    return sorted(new, key=lambda p: p["post_date"])
+
+
+def _ingest_post(state: dict, newsletter_url: str, post: dict) -> bool:
+    """Fetch and summarize one post into the summary cache. Returns True once the post is done."""
+    post_url = post["url"]
+    cache_id = summary_id_for_url(post_url)
+    try:
+        if get_cached_summary(cache_id) is None:
+            article_text = get_article(post_url)
+            # the same text may already be summarized under another alias (post id, pre-redirect URL)
+            if get_cached_summary_for_text(article_text) is None and not _reserve_tokens(state, _estimate_tokens(article_text)):
+                return False
+            with llm_route("ingest"):
+                summarize_article(cache_id, article_text)
+    except Exception as e:
+        print(f"ingest: failed {post_url}: {e}")
+        return False
+    with _STATE_LOCK:
+        state["newsletters"][newsletter_url]["done"].append(post_url)
+        _save_state(state)
+    return True
+
+
+def _advance_watermark(newsletter_state: dict, posts: list[dict]) -> None:
+    """Move the watermark up to the oldest post still pending (or the newest post if none) and prune done."""
+    done = set(newsletter_state["done"])
+    candidates = [p for p in posts if p.get("url") and p.get("post_date", "") >= newsletter_state["watermark"]]
+    pending = [p["post_date"] for p in candidates if p["url"] not in done]
+    if pending:
+        watermark = min(pending)
+    elif candidates:
+        watermark = max(p["post_date"] for p in candidates)
+    else:
+        return
+    dates = {p["url"]: p["post_date"] for p in posts if p.get("url")}
+    newsletter_state["watermark"] = watermark
+    newsletter_state["done"] = [url for url in newsletter_state["done"] if dates.get(url, watermark) >= watermark]
+
+
+def run_once(state: dict) -> int:
+    """Ingest new posts for all subscribed newsletters once; return the number of posts summarized."""
+    jobs = []
+    posts_by_newsletter = {}
+    for newsletter_url in _get_newsletter_urls():
+        newsletter_state = state["newsletters"].setdefault(
+            newsletter_url,
+            {"watermark": (date.today() - timedelta(days=LOOKBACK_DAYS)).isoformat(), "done": []},
+        )
+        try:
+            posts = get_posts_list(newsletter_url, POSTS_PER_NEWSLETTER, refresh=True)
+        except Exception as e:
+            print(f"ingest: failed to list {newsletter_url}: {e}")
+            continue
+        posts_by_newsletter[newsletter_url] = posts
+        jobs.extend((newsletter_url, post) for post in _new_posts(newsletter_state, posts))
+    with ThreadPoolExecutor(max_workers=INGEST_CONCURRENCY, thread_name_prefix="ingest") as pool:
+        results = list(pool.map(lambda job: _ingest_post(state, *job), jobs))
+    with _STATE_LOCK:
+        for newsletter_url, posts in posts_by_newsletter.items():
+            _advance_watermark(state["newsletters"][newsletter_url], posts)
+        _save_state(state)
+    return sum(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-summarize new posts for all subscribed newsletters.")
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    args = parser.parse_args()
+    state = _load_state()
+    while True:
+        started = time.monotonic()
+        try:
+            count = run_once(state)
+            print(f"ingest: summarized {count} new posts")
+        except Exception as e:
+            print(f"ingest: pass failed: {e}")
+        if args.once:
+            break
+        time.sleep(max(0.0, INGEST_INTERVAL_SECONDS - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""Shared LLM client for summaries and context analysis.
+
+One process-wide client (get_client()) instead of a new Groq client per call, with:
+
+- a token bucket for requests and tokens per minute, kept in step with the provider's x-ratelimit-* headers
+  (and Retry-After on 429), so bursts wait locally instead of being rejected upstream;
+- at most LLM_MAX_CONCURRENCY calls in flight and a timeout on every call;
+- retries with full jitter on 429, 5xx, timeouts and connection errors;
+- complete_json(), which repairs common formatting slips (code fences, prose around the object, trailing
+  commas) and otherwise asks the model once more before giving up with LLMError;
+- prompt/completion token and cost accounting per route (see llm_route() and get_usage()).
+
+Set LLM_BACKEND=fake to answer every call locally and deterministically (no API key, no network), e.g. to
+exercise the summary routes offline.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, NamedTuple
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "groq")
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 60))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+LLM_MAX_RETRIES = 3
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 20
+JSON_MAX_ATTEMPTS = 2
+# starting limits until the first response's rate-limit headers tell us the real ones
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 30))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", 12000))
+FAKE_BACKEND_RATE_LIMIT = 10 ** 9  # per minute, for requests and tokens: offline runs are not throttled
+DEFAULT_MAX_OUTPUT_TOKENS = 1024  # reserved from the token bucket when a call sets no max_tokens
+# USD per million (prompt, completion) tokens
+MODEL_PRICES = {
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+}
+DEFAULT_ROUTE = "default"
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class LLMError(Exception):
+    """The LLM call failed after retries, or its reply could not be used."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough local token count: words and punctuation marks plus a third for sub-word splits, and at least
+    one token per 4 characters (long unbroken strings such as URLs)."""
+    return max(len(_TOKEN_RE.findall(text)) * 4 // 3, len(text) // 4)
+
+
+def _estimate_messages(messages: list[dict]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") + 4 for m in messages)
+
+
+def _parse_duration(value: str | None) -> float | None:
+    """Parse rate-limit reset values such as "7.66s", "2m59.56s", "120ms" or "3" (seconds)."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    matched = False
+    for number, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        matched = True
+        total += float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if matched else None
+
+
+def _header_int(headers, name: str) -> int | None:
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+class _TokenBucket:
+    """capacity units refilled evenly over a minute; the server's remaining/reset figures override ours."""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self._available = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    def acquire(self, amount: float) -> None:
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = max(self._blocked_until - now, (amount - self._available) * 60 / self.capacity)
+            time.sleep(min(max(wait, 0.01), RETRY_MAX_DELAY_SECONDS))
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self._available = min(self.capacity, self._available + amount)
+
+    def update(self, limit: int | None, remaining: int | None, reset_seconds: float | None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.capacity = limit
+            if remaining is not None:
+                self._available = min(self.capacity, remaining)
+                if remaining <= 0 and reset_seconds:
+                    self._blocked_until = max(self._blocked_until, now + reset_seconds)
+
+    def block_for(self, seconds: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class _Usage(NamedTuple):
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class _RetryableError(Exception):
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _GroqBackend:
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from groq import Groq
+
+                    api_key = os.environ.get("GROQ_API_KEY")
+                    if not api_key:
+                        raise ValueError("GROQ_API_KEY environment variable is not set")
+                    # retries are ours (rate-limit aware, jittered), not the SDK's
+                    self._client = Groq(api_key=api_key, max_retries=0)
+        return self._client
+
+    def _create(self, timeout: float, **params):
+        import groq
+
+        try:
+            raw = self._get_client().chat.completions.with_raw_response.create(timeout=timeout, **params)
+        except groq.APIStatusError as e:
+            if e.status_code == 429 or e.status_code >= 500:
+                raise _RetryableError(str(e), _parse_duration(e.response.headers.get("retry-after"))) from e
+            raise
+        except (groq.APITimeoutError, groq.APIConnectionError) as e:
+            raise _RetryableError(str(e)) from e
+        return raw.headers, raw.parse()
+
+    def complete(self, messages, model, timeout, **params):
+        headers, completion = self._create(timeout, messages=messages, model=model, **params)
+        usage = completion.usage
+        return (
+            completion.choices[0].message.content or "",
+            _Usage(usage.prompt_tokens, usage.completion_tokens) if usage else None,
+            headers,
+        )
+
+    def stream(self, messages, model, timeout, **params):
+        headers, stream = self._create(timeout, messages=messages, model=model, stream=True, **params)
+
+        def chunks():
+            for chunk in stream:
+                usage = chunk.usage or getattr(chunk.x_groq, "usage", None)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                yield delta or "", _Usage(usage.prompt_tokens, usage.completion_tokens) if usage else None
+
+        return chunks(), headers
+
+
+class _FakeBackend:
+    """Offline stand-in: JSON requests get a summary-shaped object built from the input, others an excerpt."""
+
+    def _reply(self, messages, params) -> str:
+        text = " ".join((messages[-1].get("content") or "").split())
+        words = text.split()
+        if params.get("response_format", {}).get("type") == "json_object":
+            return json.dumps({"short_summary": " ".join(words[:50]), "full_summary": " ".join(words[:200])})
+        system = messages[0].get("content") or ""
+        if "---" in system:  # the streaming summary format: short line, separator, full text
+            return " ".join(words[:50]) + "\n---\n" + " ".join(words[:200])
+        return " ".join(words[:150])
+
+    def _usage(self, messages, reply) -> _Usage:
+        return _Usage(_estimate_messages(messages), estimate_tokens(reply))
+
+    def complete(self, messages, model, timeout, **params):
+        reply = self._reply(messages, params)
+        return reply, self._usage(messages, reply), {}
+
+    def stream(self, messages, model, timeout, **params):
+        reply = self._reply(messages, params)
+
+        def chunks():
+            pieces = re.findall(r"\S+\s*|\s+", reply)
+            for piece in pieces:
+                yield piece, None
+            yield "", self._usage(messages, reply)
+
+        return chunks(), {}
+
+
+_ROUTE: ContextVar[str] = ContextVar("llm_route", default=DEFAULT_ROUTE)
+
+
+@contextmanager
+def llm_route(name: str):
+    """Attribute LLM calls made inside the block (and in asyncio.to_thread calls it makes) to route name."""
+    token = _ROUTE.set(name)
+    try:
+        yield
+    finally:
+        _ROUTE.reset(token)
+
+
+def _parse_json(text: str) -> dict:
+    """Parse a reply that must be a JSON object; raises ValueError for anything else (arrays, scalars)."""
+    value = _loads_repaired(text)
+    if not isinstance(value, dict):
+        raise ValueError("reply is not a JSON object")
+    return value
+
+
+def _loads_repaired(text: str):
+    """json.loads with repairs for code fences, text around the object and trailing commas."""
+    text = text.strip()
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("no JSON object in reply")
+    candidate = text[start:end + 1]
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return json.loads(re.sub(r",\s*([}\]])", r"\1", candidate))
+
+
+class LLMClient:
+    def __init__(
+        self,
+        backend=None,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+    ):
+        if backend is None and LLM_BACKEND == "fake":
+            # no provider to protect, so the Groq limits would only slow offline runs down
+            backend = _FakeBackend()
+            requests_per_minute = tokens_per_minute = FAKE_BACKEND_RATE_LIMIT
+        elif backend is None:
+            backend = _GroqBackend()
+        self.backend = backend
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self._usage: dict[str, dict] = {}
+        self._usage_lock = threading.Lock()
+
+    def complete(
+        self,
+        messages: list[dict],
+        model: str,
+        *,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        **params,
+    ) -> str:
+        """Return the reply text for a chat completion."""
+        reserved = self._reserve(messages, params)
+        route = _ROUTE.get()
+        with self._slots:
+            text, usage, headers = self._with_retries(
+                lambda: self.backend.complete(messages, model, timeout, **params), route
+            )
+        self._settle(reserved, headers, usage, messages, text, model, route)
+        return text
+
+    def complete_json(self, messages: list[dict], model: str, **kwargs) -> dict:
+        """complete() asking for a JSON object; repairs or re-asks (up to JSON_MAX_ATTEMPTS) on a malformed reply."""
+        kwargs.setdefault("response_format", {"type": "json_object"})
+        for attempt in range(JSON_MAX_ATTEMPTS):
+            text = self.complete(messages, model, **kwargs)
+            try:
+                return _parse_json(text)
+            except ValueError:
+                messages = messages + [
+                    {"role": "assistant", "content": text},
+                    {"role": "user", "content": "That was not valid JSON. Reply with only the JSON object."},
+                ]
+        self._record(_ROUTE.get(), errors=1)
+        raise LLMError("model did not return valid JSON")
+
+    def stream(
+        self,
+        messages: list[dict],
+        model: str,
+        *,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        **params,
+    ) -> Iterator[str]:
+        """Yield reply text deltas as they arrive. Only opening the stream is retried."""
+        reserved = self._reserve(messages, params)
+        route = _ROUTE.get()
+        with self._slots:
+            chunks, headers = self._with_retries(
+                lambda: self.backend.stream(messages, model, timeout, **params), route
+            )
+            parts = []
+            usage = None
+            for delta, chunk_usage in chunks:
+                usage = chunk_usage or usage
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        self._settle(reserved, headers, usage, messages, "".join(parts), model, route)
+
+    def get_usage(self) -> dict[str, dict]:
+        """Return { route: { calls, retries, errors, prompt_tokens, completion_tokens, cost_usd } }."""
+        with self._usage_lock:
+            return {route: dict(usage) for route, usage in self._usage.items()}
+
+    def _reserve(self, messages: list[dict], params: dict) -> int:
+        tokens = _estimate_messages(messages) + (params.get("max_tokens") or DEFAULT_MAX_OUTPUT_TOKENS)
+        self._requests.acquire(1)
+        self._tokens.acquire(tokens)
+        return tokens
+
+    def _with_retries(self, call, route: str):
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                return call()
+            except _RetryableError as e:
+                if attempt == LLM_MAX_RETRIES:
+                    self._record(route, errors=1)
+                    raise LLMError(f"LLM call failed after {attempt + 1} attempts: {e}") from e
+                self._record(route, retries=1)
+                delay = random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+                if e.retry_after:
+                    # everyone waits out the server's Retry-After, not just this caller
+                    self._requests.block_for(e.retry_after)
+                    delay = max(delay, e.retry_after)
+                time.sleep(delay)
+            except Exception:
+                self._record(route, errors=1)
+                raise
+        raise RuntimeError("unreachable")
+
+    def _settle(self, reserved, headers, usage, messages, text, model, route) -> None:
+        if usage is None:
+            usage = _Usage(_estimate_messages(messages), estimate_tokens(text))
+        self._tokens.refund(max(0, reserved - usage.prompt_tokens - usage.completion_tokens))
+        if headers:
+            self._requests.update(
+                None,
+                _header_int(headers, "x-ratelimit-remaining-requests"),
+                _parse_duration(headers.get("x-ratelimit-reset-requests")),
+            )
+            self._tokens.update(
+                _header_int(headers, "x-ratelimit-limit-tokens"),
+                _header_int(headers, "x-ratelimit-remaining-tokens"),
+                _parse_duration(headers.get("x-ratelimit-reset-tokens")),
+            )
+        prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        cost = (usage.prompt_tokens * prompt_price + usage.completion_tokens * completion_price) / 1_000_000
+        self._record(
+            route,
+            calls=1,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            cost_usd=cost,
+        )
+
+    def _record(self, route: str, **counts) -> None:
+        with self._usage_lock:
+            usage = self._usage.setdefault(
+                route,
+                {"calls": 0, "retries": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0},
+            )
+            for name, value in counts.items():
+                usage[name] += value
+
+
+_CLIENT: LLMClient | None = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """Return the process-wide LLMClient."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = LLMClient()
+    return _CLIENT
+
+
+def get_usage() -> dict[str, dict]:
+    return get_client().get_usage()
@@ -1,11 +1,128 @@
-from context import get_article, get_context, relate_article_to_context
+"""Relate articles to the me/ context.
 
-article_url = input("Article URL: ").strip()
-if not article_url:
-    print("No URL provided.")
-    exit(1)
-context = get_context()
-article_content = get_article(article_url)
-analysis = relate_article_to_context(article_content, context)
-print(analysis)
+    python main.py                       # prompt for one URL
+    python main.py --batch urls.txt      # one URL per line ("-" reads stdin), JSON Lines on stdout
 
+Batch mode fetches the articles concurrently, scores each locally (relevance.py) and sends only those at or
+above the threshold (or the --top N best) to the LLM analysis, on a bounded worker pool. Analyses are cached
+by article text and context version, and each result is written as soon as it is ready:
+{ url, status: "ok" | "skipped" | "error", relevance [, analysis, cached ] [, error ] }.
+"""
+import argparse
+import json
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from context import get_article, get_context, relate_article_to_context_cached
+from llm import llm_route
+from relevance import RELEVANCE_THRESHOLD, rank_scores, score_texts
+
+BATCH_FETCH_WORKERS = 8
+BATCH_ANALYSIS_WORKERS = 4
+
+
+def run_single() -> None:
+    article_url = input("Article URL: ").strip()
+    if not article_url:
+        print("No URL provided.")
+        exit(1)
+    context = get_context()
+    article_content = get_article(article_url)
+    score = score_texts([article_content])[0]
+    print(f"Local relevance: {score:.3f} (threshold {RELEVANCE_THRESHOLD})")
+    if score < RELEVANCE_THRESHOLD:
+        print("Below the relevance threshold, skipping the LLM analysis.")
+        exit(0)
+    analysis, _ = relate_article_to_context_cached(article_content, context)
+    print(analysis)
+
+
+def _read_urls(source: str) -> list[str]:
+    lines = sys.stdin if source == "-" else open(source)
+    with lines:
+        urls = [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+    return list(dict.fromkeys(urls))
+
+
+def _write(out, record: dict) -> None:
+    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+
+
+def _analyze(url: str, article_text: str, score: float, context: dict) -> dict:
+    with llm_route("main_batch"):
+        analysis, cached = relate_article_to_context_cached(article_text, context)
+    return {"url": url, "status": "ok", "relevance": round(score, 4), "analysis": analysis, "cached": cached}
+
+
+def run_batch(
+    urls: list[str],
+    out=sys.stdout,
+    threshold: float = RELEVANCE_THRESHOLD,
+    top_n: int | None = None,
+    fetch_workers: int = BATCH_FETCH_WORKERS,
+    analysis_workers: int = BATCH_ANALYSIS_WORKERS,
+) -> None:
+    """Relate every URL to the me/ context, writing one JSON line per URL as results complete."""
+    context = get_context()
+    with ThreadPoolExecutor(fetch_workers, thread_name_prefix="batch_fetch") as fetch_pool, ThreadPoolExecutor(
+        analysis_workers, thread_name_prefix="batch_analysis"
+    ) as analysis_pool:
+        fetches = {fetch_pool.submit(get_article, url): url for url in urls}
+        analyses = {}  # analysis future -> url
+        articles = []  # (url, text) held back until every fetch is done, for --top
+        pending = set(fetches)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in analyses:
+                    try:
+                        _write(out, future.result())
+                    except Exception as e:
+                        _write(out, {"url": analyses[future], "status": "error", "error": str(e)})
+                    continue
+                url = fetches[future]
+                try:
+                    article_text = future.result()
+                except Exception as e:
+                    _write(out, {"url": url, "status": "error", "error": f"fetch failed: {e}"})
+                    continue
+                if top_n is not None:
+                    articles.append((url, article_text))
+                    continue
+                score = score_texts([article_text])[0]
+                if score < threshold:
+                    _write(out, {"url": url, "status": "skipped", "relevance": round(score, 4)})
+                    continue
+                analysis = analysis_pool.submit(_analyze, url, article_text, score, context)
+                analyses[analysis] = url
+                pending.add(analysis)
+            if top_n is not None and not pending.intersection(fetches) and articles:
+                # all fetched: score them in one batch and analyze only the best top_n above threshold
+                scores = score_texts([text for _, text in articles])
+                selected = {i for i, _ in rank_scores(scores, threshold, top_n)}
+                for i, (url, article_text) in enumerate(articles):
+                    if i not in selected:
+                        _write(out, {"url": url, "status": "skipped", "relevance": round(scores[i], 4)})
+                        continue
+                    analysis = analysis_pool.submit(_analyze, url, article_text, scores[i], context)
+                    analyses[analysis] = url
+                    pending.add(analysis)
+                articles = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relate articles to the me/ context.")
+    parser.add_argument("--batch", metavar="FILE", help='file with one URL per line, or "-" for stdin')
+    parser.add_argument("--threshold", type=float, default=RELEVANCE_THRESHOLD, help="minimum local relevance for the LLM analysis")
+    parser.add_argument("--top", type=int, help="analyze only the N most relevant articles (waits for all fetches)")
+    parser.add_argument("--workers", type=int, default=BATCH_ANALYSIS_WORKERS, help="concurrent LLM analyses")
+    args = parser.parse_args()
+    if not args.batch:
+        run_single()
+        return
+    run_batch(_read_urls(args.batch), threshold=args.threshold, top_n=args.top, analysis_workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Per-user, in-process cache of which post URLs a user has marked read.
+
+GET /posts asks only about the URLs it is about to render; URLs not cached (or older than
+READ_STATE_TTL_SECONDS) are looked up in one query via the loader, and /posts/read writes through so the
+writing worker never serves its own stale state. The TTL bounds how long another worker's write can go
+unseen.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+READ_STATE_TTL_SECONDS = 60
+MAX_CACHED_USERS = 1024
+
+
+class ReadStateCache:
+    def __init__(self, ttl: float = READ_STATE_TTL_SECONDS, max_users: int = MAX_CACHED_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        # user_id -> { post_url: (read, checked_at) }, least recently used user first
+        self._users: OrderedDict[str, dict[str, tuple[bool, float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user_states(self, user_id: str) -> dict[str, tuple[bool, float]]:
+        states = self._users.get(user_id)
+        if states is None:
+            states = self._users[user_id] = {}
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return states
+
+    def get_read_urls(
+        self,
+        user_id: str,
+        urls: Iterable[str],
+        loader: Callable[[str, list[str]], set[str]],
+    ) -> set[str]:
+        """Return the subset of urls the user has read. loader(user_id, urls) returns the read subset of urls."""
+        urls = list(dict.fromkeys(u for u in urls if u))
+        now = time.monotonic()
+        read = set()
+        missing = []
+        with self._lock:
+            states = self._user_states(user_id)
+            for url in urls:
+                state = states.get(url)
+                if state is None or now - state[1] >= self.ttl:
+                    missing.append(url)
+                elif state[0]:
+                    read.add(url)
+        if missing:
+            loaded = loader(user_id, missing)
+            with self._lock:
+                states = self._user_states(user_id)
+                for url in missing:
+                    states[url] = (url in loaded, now)
+            read.update(loaded)
+        return read
+
+    def set(self, user_id: str, url: str, read: bool) -> None:
+        with self._lock:
+            self._user_states(user_id)[url] = (read, time.monotonic())
@@ -0,0 +1,91 @@
+"""Local relevance scoring of articles against the me/ context, with no network and no LLM.
+
+Texts are turned into TF-IDF vectors over the context's vocabulary (context_index.py) and compared with
+every context passage in one NumPy matrix product; an article's score is the mean cosine similarity of its
+RELEVANCE_TOP_PASSAGES best-matching passages, in [0, 1]. Hundreds of posts score in well under a second,
+so this runs on every listed post, and only articles that rank_scores() keeps (at least the threshold,
+at most the top N) go on to the LLM analysis (context.relate_article_to_context).
+"""
+import math
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+
+from context_index import ContextIndex, get_context_index, tokenize
+
+RELEVANCE_THRESHOLD = float(os.environ.get("RELEVANCE_THRESHOLD", 0.05))
+RELEVANCE_TOP_N = int(os.environ.get("RELEVANCE_TOP_N", 20))
+RELEVANCE_TOP_PASSAGES = 3
+
+
+class RelevanceScorer:
+    """TF-IDF passage matrix for one version of the context."""
+
+    def __init__(self, index: ContextIndex):
+        self.version = index.version
+        self.vocabulary = {term: i for i, term in enumerate(sorted(index.postings))}
+        self.idf = np.array([index.idf(term) for term in sorted(index.postings)], dtype=np.float32)
+        # terms the context never uses can't match a passage, but they still dilute an article's vector
+        self.unseen_idf = index.idf("") if index.passages else 0.0
+        passages = np.zeros((len(index.passages), len(self.vocabulary)), dtype=np.float32)
+        for term, postings in index.postings.items():
+            column = self.vocabulary[term]
+            for row, tf in postings:
+                passages[row, column] = 1 + math.log(tf)
+        passages *= self.idf
+        norms = np.linalg.norm(passages, axis=1, keepdims=True)
+        self.passages = passages / np.where(norms == 0, 1, norms)
+
+    def score(self, texts: list[str]) -> np.ndarray:
+        """Return one relevance score per text (0 = nothing in common with the context)."""
+        if not texts or not len(self.passages):
+            return np.zeros(len(texts), dtype=np.float32)
+        vectors = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        unseen = np.zeros(len(texts), dtype=np.float32)  # squared norm contributed by out-of-vocabulary terms
+        for row, text in enumerate(texts):
+            for term, tf in Counter(tokenize(text)).items():
+                weight = 1 + math.log(tf)
+                column = self.vocabulary.get(term)
+                if column is None:
+                    unseen[row] += (weight * self.unseen_idf) ** 2
+                else:
+                    vectors[row, column] = weight
+        vectors *= self.idf
+        norms = np.sqrt((vectors ** 2).sum(axis=1) + unseen)
+        vectors /= np.where(norms == 0, 1, norms)[:, None]
+        similarities = vectors @ self.passages.T
+        top = min(RELEVANCE_TOP_PASSAGES, similarities.shape[1])
+        best = np.partition(similarities, -top, axis=1)[:, -top:]
+        return best.mean(axis=1)
+
+
+_SCORER: RelevanceScorer | None = None
+_SCORER_LOCK = threading.Lock()
+
+
+def get_scorer() -> RelevanceScorer:
+    """Return the scorer for the current me/ context, rebuilt when me/ changes."""
+    global _SCORER
+    index = get_context_index()
+    with _SCORER_LOCK:
+        if _SCORER is None or _SCORER.version != index.version:
+            _SCORER = RelevanceScorer(index)
+        return _SCORER
+
+
+def score_texts(texts: list[str]) -> list[float]:
+    """Relevance of each text to the me/ context, in [0, 1]."""
+    return [float(score) for score in get_scorer().score(texts)]
+
+
+def rank_scores(
+    scores: list[float],
+    threshold: float = RELEVANCE_THRESHOLD,
+    top_n: int | None = RELEVANCE_TOP_N,
+) -> list[tuple[int, float]]:
+    """Return (index, score) for the scores worth an LLM relevance call, best first: those at least
+    threshold, capped at top_n (None = no cap)."""
+    ranked = sorted(((i, s) for i, s in enumerate(scores) if s >= threshold), key=lambda pair: pair[1], reverse=True)
+    return ranked[:top_n] if top_n is not None else ranked
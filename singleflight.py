@@ -0,0 +1,110 @@
+"""Single-flight request coalescing keyed by cache key.
+
+Concurrent callers asking for the same key wait on one in-flight computation instead of each doing the
+fetch / LLM call themselves. Within a process this uses a shared Future-like record per key; across
+gunicorn workers the leader additionally holds an flock()ed lock file, and re-checks the cache after
+acquiring it so a worker that waited on another worker picks up its result.
+
+Each key has its own lock file in LOCK_DIR (a temp directory unless SINGLE_FLIGHT_LOCK_DIR is set), so
+unrelated keys never wait on each other. The leader unlinks the file before releasing it, which keeps
+the directory down to the computations in flight; a waiter that then gets the lock on the unlinked file
+notices and locks the current one instead.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; fall back to in-process coalescing only
+    fcntl = None
+
+LOCK_DIR = Path(os.environ.get("SINGLE_FLIGHT_LOCK_DIR", Path(tempfile.gettempdir()) / "single_flight_locks"))
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+_CALLS: dict[str, _Call] = {}
+_CALLS_LOCK = threading.Lock()
+
+
+def single_flight(
+    key: str,
+    compute: Callable[[], T],
+    cached: Callable[[], T | None] | None = None,
+    cross_process: bool = True,
+) -> T:
+    """Return compute() for key, running it at most once at a time for all concurrent callers.
+
+    cached, if given, returns the already-stored value (or None); it is checked by the leader once it
+    holds the lock, so callers that lost a race with another thread or worker don't recompute.
+    Set cross_process=False for results that are only cached in process memory.
+    """
+    with _CALLS_LOCK:
+        call = _CALLS.get(key)
+        leader = call is None
+        if leader:
+            call = _CALLS[key] = _Call()
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+    try:
+        call.result = _run_leader(key, compute, cached, cross_process)
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _CALLS_LOCK:
+            del _CALLS[key]
+        call.done.set()
+    return call.result
+
+
+def _run_leader(key: str, compute: Callable[[], T], cached: Callable[[], T | None] | None, cross_process: bool) -> T:
+    if not cross_process or fcntl is None:
+        return _cached_or_compute(compute, cached)
+    with _file_lock(key):
+        return _cached_or_compute(compute, cached)
+
+
+def _cached_or_compute(compute: Callable[[], T], cached: Callable[[], T | None] | None) -> T:
+    if cached is not None:
+        value = cached()
+        if value is not None:
+            return value
+    return compute()
+
+
+@contextmanager
+def _file_lock(key: str):
+    LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    lock_path = LOCK_DIR / f"{hashlib.sha256(key.encode()).hexdigest()}.lock"
+    while True:
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                current = os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if not current:
+                continue  # the previous holder unlinked this file while we waited on it
+            try:
+                yield
+            finally:
+                # unlink while still holding the lock, so nobody can lock this file and think they own the key
+                lock_path.unlink(missing_ok=True)
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            return
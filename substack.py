@@ -1,58 +1,166 @@
-from pathlib import Path
+import statistics
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 from substack_api import Newsletter
+from cache import Cache
+from fetch import fetch_json
 from htmlstripper import _strip_html
-from summarize_article import summarize_article
+from summarize_article import summarize_article, summary_id_for_url
 from get_title import get_title
+from singleflight import single_flight
+from context import cache_article, get_cached_article
 
-CONTENT_CACHE_DIR = Path("content_cache")
-
-# Cache for get_posts_list: (normalized_url, limit) -> (cached_at, list[dict])
-_POSTS_LIST_CACHE: dict[tuple[str, int], tuple[float, list[dict]]] = {}
+# A post list is fresh for a quarter of the newsletter's median gap between posts, clamped to these bounds;
+# after that it is still served (stale) while a background refresh runs, for up to POSTS_LIST_MAX_STALE_SECONDS.
+POSTS_LIST_MIN_FRESH_SECONDS = 30 * 60
 POSTS_LIST_CACHE_MAX_AGE_SECONDS = 12 * 3600  # 12 hours
+POSTS_LIST_FRESH_FRACTION_OF_GAP = 0.25
+POSTS_LIST_MAX_STALE_SECONDS = 7 * 24 * 3600
+ARCHIVE_PAGE_SIZE = 50  # the archive API's largest page
+POST_FETCH_CONCURRENCY = 5
+
+# "<normalized_url>|<limit>" -> { posts: list[dict], fresh_until: time.time() }
+_POSTS_LIST_CACHE = Cache("post_lists", ttl=POSTS_LIST_MAX_STALE_SECONDS, max_items=512)
+_REFRESH_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="posts_list_refresh")
+_REFRESHING: set[str] = set()
+_REFRESHING_LOCK = threading.Lock()
 
 
-def get_posts_list(newsletter_url: str, limit: int = 20) -> list[dict]:
-    """Return list of { id, title, url, post_date } for a newsletter (no content/summary)."""
+def get_posts_list(newsletter_url: str, limit: int = 20, refresh: bool = False) -> list[dict]:
+    """Return list of { id, title, subtitle, url, post_date } for a newsletter (no content/summary).
+    A stale cached list is returned immediately and refreshed in the background.
+    refresh=True skips the cached list (the fresh one is still cached).
+    """
     if not newsletter_url.startswith(("http://", "https://")):
         newsletter_url = "https://" + newsletter_url
-    cache_key = (newsletter_url, limit)
-    now = time.monotonic()
-    if cache_key in _POSTS_LIST_CACHE:
-        cached_at, cached_list = _POSTS_LIST_CACHE[cache_key]
-        if (now - cached_at) < POSTS_LIST_CACHE_MAX_AGE_SECONDS:
-            return cached_list
-    newsletter = Newsletter(newsletter_url)
-    posts = newsletter.get_posts(limit=limit)
+    cache_key = f"{newsletter_url}|{limit}"
+    if not refresh:
+        cached = _POSTS_LIST_CACHE.get(cache_key)
+        if cached is not None:
+            if time.time() >= cached["fresh_until"]:
+                _refresh_in_background(newsletter_url, limit)
+            return cached["posts"]
+    return single_flight(
+        f"posts_list:{cache_key}",
+        lambda: _fetch_posts_list(newsletter_url, limit),
+        cached=None if refresh else lambda: _get_fresh_posts_list(cache_key, use_memory=False),
+    )
+
+
+def _get_fresh_posts_list(cache_key: str, use_memory: bool = True) -> list[dict] | None:
+    cached = _POSTS_LIST_CACHE.get(cache_key, use_memory)
+    if cached is not None and time.time() < cached["fresh_until"]:
+        return cached["posts"]
+    return None
+
+
+def _refresh_in_background(newsletter_url: str, limit: int) -> None:
+    cache_key = f"{newsletter_url}|{limit}"
+    with _REFRESHING_LOCK:
+        if cache_key in _REFRESHING:
+            return
+        _REFRESHING.add(cache_key)
+
+    def refresh():
+        try:
+            # another worker may already have refreshed it; _get_fresh_posts_list picks that up
+            single_flight(
+                f"posts_list:{cache_key}",
+                lambda: _fetch_posts_list(newsletter_url, limit),
+                cached=lambda: _get_fresh_posts_list(cache_key, use_memory=False),
+            )
+        except Exception as e:
+            print(f"posts list refresh failed for {newsletter_url}: {e}")
+        finally:
+            with _REFRESHING_LOCK:
+                _REFRESHING.discard(cache_key)
+
+    _REFRESH_POOL.submit(refresh)
+
+
+def _fresh_seconds(metas: list[dict]) -> float:
+    """How long a post list stays fresh, from how often the newsletter publishes."""
+    timestamps = []
+    for meta in metas:
+        try:
+            timestamps.append(datetime.fromisoformat(meta["post_date"]).timestamp())
+        except (KeyError, TypeError, ValueError):
+            continue
+    timestamps.sort()
+    gaps = [later - earlier for earlier, later in zip(timestamps, timestamps[1:])]
+    if not gaps:
+        return POSTS_LIST_CACHE_MAX_AGE_SECONDS
+    fresh = statistics.median(gaps) * POSTS_LIST_FRESH_FRACTION_OF_GAP
+    return min(max(fresh, POSTS_LIST_MIN_FRESH_SECONDS), POSTS_LIST_CACHE_MAX_AGE_SECONDS)
+
+
+def _fetch_posts_list(newsletter_url: str, limit: int) -> list[dict]:
+    metas = get_archive_posts(newsletter_url, limit)
     rv = []
-    for post in posts:
-        meta = post.get_metadata()
+    for meta in metas:
         post_date = meta.get("post_date") or ""
         if len(post_date) >= 10:
             post_date = post_date[:10]
         rv.append({
             "id": meta.get("id"),
             "title": meta.get("title"),
+            "subtitle": meta.get("subtitle"),
             "url": meta.get("canonical_url"),
             "post_date": post_date,
         })
     rv = sorted(rv, key=lambda x: x["post_date"], reverse=True)
-    _POSTS_LIST_CACHE[cache_key] = (now, rv)
+    _POSTS_LIST_CACHE.set(f"{newsletter_url}|{limit}", {"posts": rv, "fresh_until": time.time() + _fresh_seconds(metas)})
     return rv
 
 
-def _get_content(post) -> str:
-    post_id = post.get_metadata().get("id")
-    if post_id is not None:
-        cache_path = CONTENT_CACHE_DIR / f"{post_id}.txt"
-        if cache_path.exists():
-            return cache_path.read_text()
-    content = _strip_html(post.get_content())
-    if post_id is not None:
-        CONTENT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
-        cache_path = CONTENT_CACHE_DIR / f"{post_id}.txt"
-        cache_path.write_text(content)
+def get_archive_posts(newsletter_url: str, limit: int) -> list[dict]:
+    """Return up to limit raw post dicts (id, title, slug, canonical_url, post_date, ...), newest first.
+
+    Everything a listing needs comes straight from the archive API, one request per ARCHIVE_PAGE_SIZE posts,
+    instead of one metadata request per post.
+    """
+    rv = []
+    while len(rv) < limit:
+        page_size = min(ARCHIVE_PAGE_SIZE, limit - len(rv))
+        page = _get_archive_page(newsletter_url, offset=len(rv), limit=page_size)
+        rv.extend(page)
+        if len(page) < page_size:
+            break
+    return rv[:limit]
+
+
+def _get_archive_page(newsletter_url: str, offset: int, limit: int) -> list[dict]:
+    """Return raw post dicts from the newsletter's archive API, fetched through the pooled fetcher."""
+    url = f"{newsletter_url.rstrip('/')}/api/v1/archive?sort=new&search=&offset={offset}&limit={limit}"
+    return fetch_json(url) or []
+
+
+def _get_content(newsletter_url: str, meta: dict) -> str:
+    """Return the stripped body of an archive post, fetching the post API only on an article cache miss.
+
+    The text is kept in context's URL-keyed article cache under the post's canonical URL, so get_article
+    and /posts/summary find it there too.
+    """
+    url = meta.get("canonical_url")
+    if url:
+        article = get_cached_article(url)
+        if article is not None:
+            return article["text"]
+    post = fetch_json(f"{newsletter_url.rstrip('/')}/api/v1/posts/{meta.get('slug')}")
+    content = _strip_html(post.get("body_html") or "")
+    if url:
+        cache_article(
+            url,
+            {
+                "text": content,
+                "title": meta.get("title") or "",
+                "subtitle": meta.get("subtitle"),
+                "post_date": (meta.get("post_date") or "")[:10],
+            },
+        )
     return content
 
 
@@ -61,23 +169,30 @@ def get_posts(newsletter_url: str, cut_off: str | None = None) -> list[dict]:
     # if url is missing the protocol, add https://
     if not newsletter_url.startswith(("http://", "https://")):
         newsletter_url = "https://" + newsletter_url
-    newsletter = Newsletter(newsletter_url)
-    posts = newsletter.get_posts(limit=5)
-    rv = []
-    for post in posts:
-        post_date = post.get_metadata().get("post_date")
+    metas = []
+    for meta in get_archive_posts(newsletter_url, 5):
+        post_date = meta.get("post_date")
         if cut_off is not None and (not post_date or len(post_date) < 10 or post_date[:10] < cut_off):
             continue
-        post_date = post_date[:10]
-        content = _get_content(post)
-        rv.append({
-            "id": post.get_metadata().get("id"),
-            "title": post.get_metadata().get("title"),
-            "url": post.get_metadata().get("canonical_url"),
-            "post_date": post_date,
+        metas.append(meta)
+
+    def build(meta: dict) -> dict:
+        content = _get_content(newsletter_url, meta)
+        return {
+            "id": meta.get("id"),
+            "title": meta.get("title"),
+            "url": meta.get("canonical_url"),
+            "post_date": meta.get("post_date")[:10],
             "content": content,
-            "summary": summarize_article(post.get_metadata().get("id"), content),
-        })
+            "summary": summarize_article(
+                meta.get("id"),
+                content,
+                aliases=(summary_id_for_url(meta["canonical_url"]),) if meta.get("canonical_url") else (),
+            ),
+        }
+
+    with ThreadPoolExecutor(max_workers=POST_FETCH_CONCURRENCY, thread_name_prefix="get_posts") as pool:
+        rv = list(pool.map(build, metas))
     return sorted(rv, key=lambda x: x["post_date"], reverse=True)
 
 
@@ -1,34 +1,236 @@
-import os
-import json
-from pathlib import Path
+import contextvars
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-from groq import Groq
+from cache import Cache
+from llm import estimate_tokens, get_client
+from singleflight import single_flight
 
 GROQ_MODEL = "llama-3.3-70b-versatile"
 
-_CACHE_DIR = Path(__file__).parent / "cache"
+# Summaries are stored under a hash of the normalized article text, the model and SUMMARY_PROMPT_VERSION
+# (bump it whenever the summary prompts change), so every entry point shares one summary per distinct
+# article and a model or prompt change never serves an old summary. Post ids and URL ids are aliases that
+# point at that hash, for lookups that happen before the article has been fetched.
+SUMMARY_PROMPT_VERSION = "2"
+# query parameters that don't change which post a URL points at
+TRACKING_QUERY_PARAMS = frozenset({"r", "s", "ref", "fbclid", "gclid", "triedRedirect", "showWelcome", "publication_id", "post_id", "isFreemail"})
+
+# Articles estimated above SINGLE_CALL_MAX_TOKENS are split on paragraph boundaries into chunks of at most
+# CHUNK_MAX_TOKENS, the chunks are summarized concurrently (map), and the summary is written from the
+# chunk summaries (reduce). Chunk summaries are cached by content, so an edited article only re-does the
+# chunks that changed.
+SINGLE_CALL_MAX_TOKENS = 6000
+CHUNK_MAX_TOKENS = 3000
+CHUNK_CONCURRENCY = 4
+CHUNK_PROMPT_VERSION = "1"
+CHUNK_SYSTEM_PROMPT = """You are given one section of a longer article.
+    Summarize the section in about 150 words, keeping its key claims, names and numbers.
+    No labels, markdown or other formatting.
+    """
+
+# Streaming variant: plain text instead of JSON so the short summary can be shown before the full one is done
+STREAM_SEPARATOR = "---"
+STREAM_SYSTEM_PROMPT = f"""You summarize an article in two ways: short and full.
+    First write the short summary, 50 words or less, on a single line.
+    Then write a line containing only {STREAM_SEPARATOR}
+    Then write the full summary, around 200 words.
+    No labels, markdown or other formatting.
+    """
+
+
+def summary_id_for_url(post_url: str) -> str:
+    """Summary alias for a post URL, stable across scheme, host case, trailing slashes and tracking parameters."""
+    return hashlib.sha1(_normalize_url(post_url).encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    query = [
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name not in TRACKING_QUERY_PARAMS and not name.startswith("utm_")
+    ]
+    return urlunsplit(("https", parts.netloc.lower(), parts.path.rstrip("/"), urlencode(sorted(query)), ""))
+
+
+def summary_key(article_text: str, model: str = GROQ_MODEL) -> str:
+    """Content address of the summary of article_text by model."""
+    normalized = " ".join(article_text.split())
+    return hashlib.sha256(f"{model}\0{SUMMARY_PROMPT_VERSION}\0{normalized}".encode()).hexdigest()
+
+
+def _alias_key(id, model: str) -> str:
+    return f"{model}\0{SUMMARY_PROMPT_VERSION}\0{id}"
+
+
+_SUMMARY_CACHE = Cache("summaries_by_content")
+_SUMMARY_ALIASES = Cache("summary_aliases", max_items=8192)
+_CHUNK_CACHE = Cache("summary_chunks", max_items=2048)
+_CHUNK_POOL = ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY, thread_name_prefix="summary_chunk")
+
+
+def get_cached_summary(id: str, model: str = GROQ_MODEL):
+    """Return the cached summary for a post id or URL id (alias), or None if it has not been summarized yet."""
+    key = _SUMMARY_ALIASES.get(_alias_key(id, model))
+    return _SUMMARY_CACHE.get(key) if key is not None else None
+
+
+def get_cached_summary_for_text(article_text: str, model: str = GROQ_MODEL):
+    """Return the cached summary of article_text, or None."""
+    return _SUMMARY_CACHE.get(summary_key(article_text, model))
 
 
-def summarize_article(id: str, article_text: str, model: str = GROQ_MODEL) -> str:
-    _CACHE_DIR.mkdir(exist_ok=True)
-    cache_path = _CACHE_DIR / f"{id}.txt"
-    if cache_path.exists():
-        return json.loads(cache_path.read_text())
+def _link_aliases(ids, key: str, model: str) -> None:
+    for id in ids:
+        if id is not None and _SUMMARY_ALIASES.get(_alias_key(id, model)) != key:
+            _SUMMARY_ALIASES.set(_alias_key(id, model), key)
+
+
+def summarize_article(id: str, article_text: str, model: str = GROQ_MODEL, aliases=()) -> str:
+    """Return the summary of article_text, summarizing it only if this text has no summary by model yet.
+
+    id (a post id or summary_id_for_url) and any further aliases are pointed at the result for
+    get_cached_summary.
+    """
+    key = summary_key(article_text, model)
+    summary = _SUMMARY_CACHE.get(key)
+    if summary is None:
+        # concurrent requests for the same article (in this process or another worker) share one Groq call
+        summary = single_flight(
+            f"summary:{key}",
+            lambda: _summarize(id, key, article_text, model),
+            cached=lambda: _SUMMARY_CACHE.get(key, use_memory=False),
+        )
+    _link_aliases([id, *aliases], key, model)
+    return summary
+
+
+def _split_chunks(text: str, max_tokens: int = CHUNK_MAX_TOKENS) -> list[str]:
+    """Pack paragraphs (lines) into chunks of at most max_tokens; oversized paragraphs are split on sentences."""
+    pieces = []
+    for paragraph in text.splitlines():
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            while estimate_tokens(sentence) > max_tokens:
+                # no sentence breaks to split on: cut by characters (~3 per token)
+                pieces.append(sentence[:max_tokens * 3])
+                sentence = sentence[max_tokens * 3:]
+            if sentence:
+                pieces.append(sentence)
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _summarize_chunk(chunk: str, model: str) -> str:
+    key = hashlib.sha256(f"{model}\0{CHUNK_PROMPT_VERSION}\0{chunk}".encode()).hexdigest()
+    cached = _CHUNK_CACHE.get(key)
+    if cached is not None:
+        return cached
+    summary = get_client().complete(
+        [{"role": "system", "content": CHUNK_SYSTEM_PROMPT}, {"role": "user", "content": chunk}],
+        model,
+    ).strip()
+    _CHUNK_CACHE.set(key, summary)
+    return summary
+
+
+def _summary_input(id: str, article_text: str, model: str) -> str:
+    """Return what the final summary call should read: the article itself, or its chunk summaries if too long."""
+    text = article_text
+    while estimate_tokens(text) > SINGLE_CALL_MAX_TOKENS:
+        chunks = _split_chunks(text)
+        print(f"Summarizing {id} in {len(chunks)} chunks")
+        # copy_context keeps the caller's llm_route for the pool threads' calls
+        futures = [_CHUNK_POOL.submit(contextvars.copy_context().run, _summarize_chunk, chunk, model) for chunk in chunks]
+        notes = [future.result() for future in futures]
+        text = "\n".join(f"Section {i}: {note}" for i, note in enumerate(notes, 1))
+    return text
+
+
+def _summarize(id: str, key: str, article_text: str, model: str):
     print(f"Using AI for {id}")
-    api_key = os.environ.get("GROQ_API_KEY")
-    if not api_key:
-        raise ValueError("GROQ_API_KEY environment variable is not set")
-    client = Groq(api_key=api_key)
+    summary_input = _summary_input(id, article_text, model)
     system_prompt = """You summarize an article in two ways: short and full.
     The short summary should be 50 words or less.
     The full summary should around 200 words.
     return a json object with the short and full summaries.
     return pure json, no markdown or other formatting.
     """
-    completion = client.chat.completions.create(
-        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": article_text}],
-        model=model,
+    result = get_client().complete_json(
+        [{"role": "system", "content": system_prompt}, {"role": "user", "content": summary_input}],
+        model,
     )
-    result = json.loads(completion.choices[0].message.content or "{}")
-    cache_path.write_text(json.dumps(result))
+    _SUMMARY_CACHE.set(key, result)
     return result
+
+
+def summarize_article_stream(id: str, article_text: str, model: str = GROQ_MODEL, aliases=()):
+    """Generate the summary as it is produced, yielding (event, data) pairs:
+
+    ("short_summary", text) once, then ("full_summary_delta", text) pieces as tokens arrive, then
+    ("done", { short_summary, full_summary }). The result is cached like summarize_article; on a cache
+    hit the full summary comes back as a single delta.
+    """
+    key = summary_key(article_text, model)
+    cached = _SUMMARY_CACHE.get(key)
+    if cached is not None:
+        _link_aliases([id, *aliases], key, model)
+        short_summary = cached.get("short_summary") or cached.get("short") or ""
+        full_summary = cached.get("full_summary") or cached.get("full") or ""
+        yield "short_summary", short_summary
+        yield "full_summary_delta", full_summary
+        yield "done", {"short_summary": short_summary, "full_summary": full_summary}
+        return
+    print(f"Using AI (stream) for {id}")
+    summary_input = _summary_input(id, article_text, model)
+    stream = get_client().stream(
+        [{"role": "system", "content": STREAM_SYSTEM_PROMPT}, {"role": "user", "content": summary_input}],
+        model,
+    )
+    head = ""  # text before the separator, buffered until the separator arrives
+    short_summary = None
+    full_parts = []
+    for delta in stream:
+        if short_summary is not None:
+            full_parts.append(delta)
+            yield "full_summary_delta", delta
+            continue
+        head += delta
+        before, sep, after = head.partition(f"\n{STREAM_SEPARATOR}")
+        if not sep:
+            continue
+        short_summary = before.strip()
+        yield "short_summary", short_summary
+        after = after.lstrip("-").lstrip()
+        if after:
+            full_parts.append(after)
+            yield "full_summary_delta", after
+    if short_summary is None:
+        # the model ignored the separator: treat everything as the full summary
+        short_summary = ""
+        yield "short_summary", short_summary
+        full_parts.append(head.strip())
+        yield "full_summary_delta", head.strip()
+    result = {"short_summary": short_summary, "full_summary": "".join(full_parts).strip()}
+    _SUMMARY_CACHE.set(key, result)
+    _link_aliases([id, *aliases], key, model)
+    yield "done", result
@@ -0,0 +1,97 @@
+"""Offline tests for llm.LLMClient: retries, JSON repair and rate-limit bookkeeping, driven by a stub backend."""
+import time
+import unittest
+from unittest import mock
+
+import llm
+
+
+class _StubBackend:
+    """Plays back scripted replies: an exception is raised, a (text, headers) pair is returned."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def complete(self, messages, model, timeout, **params):
+        self.calls.append(messages)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        text, headers = reply
+        return text, llm._Usage(10, 5), headers
+
+
+def _client(*replies) -> tuple[llm.LLMClient, _StubBackend]:
+    backend = _StubBackend(*replies)
+    return llm.LLMClient(backend, requests_per_minute=1000, tokens_per_minute=1_000_000), backend
+
+
+@mock.patch.object(llm, "RETRY_BASE_DELAY_SECONDS", 0)
+class LLMClientTest(unittest.TestCase):
+    def test_retries_after_429(self):
+        client, backend = _client(llm._RetryableError("429 Too Many Requests"), ("hello", {}))
+        self.assertEqual(client.complete([{"role": "user", "content": "hi"}], "m"), "hello")
+        self.assertEqual(len(backend.calls), 2)
+        usage = client.get_usage()[llm.DEFAULT_ROUTE]
+        self.assertEqual((usage["calls"], usage["retries"], usage["errors"]), (1, 1, 0))
+
+    def test_gives_up_after_max_retries(self):
+        client, _ = _client(*[llm._RetryableError("503")] * (llm.LLM_MAX_RETRIES + 1))
+        with self.assertRaises(llm.LLMError):
+            client.complete([{"role": "user", "content": "hi"}], "m")
+        self.assertEqual(client.get_usage()[llm.DEFAULT_ROUTE]["errors"], 1)
+
+    def test_repairs_fenced_json_with_trailing_comma(self):
+        client, backend = _client(('```json\n{"short_summary": "a", "full_summary": "b",}\n```', {}))
+        self.assertEqual(client.complete_json([{"role": "user", "content": "x"}], "m"), {"short_summary": "a", "full_summary": "b"})
+        self.assertEqual(len(backend.calls), 1)
+
+    def test_repairs_prose_around_object(self):
+        client, _ = _client(('Here you go: {"a": [1, 2,]} Hope that helps.', {}))
+        self.assertEqual(client.complete_json([{"role": "user", "content": "x"}], "m"), {"a": [1, 2]})
+
+    def test_reasks_when_reply_is_not_an_object(self):
+        client, backend = _client(("[1, 2]", {}), ('{"a": 1}', {}))
+        self.assertEqual(client.complete_json([{"role": "user", "content": "x"}], "m"), {"a": 1})
+        self.assertEqual(len(backend.calls), 2)
+        self.assertEqual(backend.calls[1][-2], {"role": "assistant", "content": "[1, 2]"})
+
+    def test_two_bad_replies_raise(self):
+        client, backend = _client(("not json", {}), ("still not json", {}))
+        with llm.llm_route("test"), self.assertRaises(llm.LLMError):
+            client.complete_json([{"role": "user", "content": "x"}], "m")
+        self.assertEqual(len(backend.calls), llm.JSON_MAX_ATTEMPTS)
+        self.assertEqual(client.get_usage()["test"]["errors"], 1)
+
+    def test_rate_limit_headers_update_buckets(self):
+        headers = {
+            "x-ratelimit-limit-tokens": "5000",
+            "x-ratelimit-remaining-tokens": "100",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "2.5s",
+        }
+        client, _ = _client(("ok", headers))
+        client.complete([{"role": "user", "content": "hi"}], "m")
+        self.assertEqual(client._tokens.capacity, 5000)
+        self.assertAlmostEqual(client._tokens._available, 100, delta=1)
+        self.assertGreater(client._requests._blocked_until, time.monotonic() + 2)
+
+    def test_fake_backend_is_not_throttled(self):
+        with mock.patch.object(llm, "LLM_BACKEND", "fake"):
+            client = llm.LLMClient()
+        self.assertIsInstance(client.backend, llm._FakeBackend)
+        start = time.monotonic()
+        for _ in range(3):
+            client.complete([{"role": "user", "content": "word " * 30000}], "m")
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_parse_duration(self):
+        self.assertEqual(llm._parse_duration("2m59.5s"), 179.5)
+        self.assertEqual(llm._parse_duration("120ms"), 0.12)
+        self.assertEqual(llm._parse_duration("3"), 3.0)
+        self.assertIsNone(llm._parse_duration("soon"))
+
+
+if __name__ == "__main__":
+    unittest.main()